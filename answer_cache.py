@@ -0,0 +1,126 @@
+# answer_cache.py
+
+import re
+import copy
+import time
+import threading
+from collections import OrderedDict
+from case_metadata import QUESTION_ROUTES
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY
+from logging_config import logger
+
+QUESTION_WORDS = re.compile(r"\b(who|whom|whose|when|where|what|which|why|how)\b", re.IGNORECASE)
+NUMBERS = re.compile(r"\d+")
+
+def normalize_question(question):
+    return " ".join(question.lower().split())
+
+def question_signature(question):
+    """
+    What a reworded question must keep to share an answer: the metadata route (filed, decided,
+    court, ...), the question words and any numbers. Embeddings alone rate "when was the case
+    filed?" and "when was the case decided?" as near duplicates.
+    """
+    route = next((name for name, pattern in QUESTION_ROUTES if pattern.search(question)), None)
+    words = tuple(sorted({word.lower() for word in QUESTION_WORDS.findall(question)}))
+    return route, words, tuple(NUMBERS.findall(question))
+
+class AnswerCache:
+    """
+    In-memory answer cache with LRU and TTL eviction.
+    Lookups try the normalized question first and then fall back to the most similar cached
+    question by embedding, among those with the same question_signature. Entries are keyed by a
+    corpus version, so they stop matching as soon as the documents change. Values are copied in
+    and out, so callers can't change what is cached.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY, embedding_function=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._embedding_function = embedding_function
+        self._entries = OrderedDict()  # key -> (value, created_at, normalized embedding or None, signature)
+        self._query_embeddings = OrderedDict()  # normalized question -> embedding
+        self._lock = threading.Lock()
+
+    def _get_embedding_function(self):
+        if self._embedding_function is None:
+            from retrieval import get_embedding_function
+            self._embedding_function = get_embedding_function()
+        return self._embedding_function
+
+    def _embed(self, question):
+        """Unit-length embedding of the question, memoized since get and put embed the same text."""
+        import numpy as np
+
+        text = normalize_question(question)
+        with self._lock:
+            vector = self._query_embeddings.get(text)
+        if vector is None:
+            vector = np.asarray(self._get_embedding_function().embed_query(text), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+            with self._lock:
+                self._query_embeddings[text] = vector
+                while len(self._query_embeddings) > self.max_size:
+                    self._query_embeddings.popitem(last=False)
+        return vector
+
+    def _is_expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, kind, question, corpus_version, semantic=True):
+        """Return the cached value for the question, or None if nothing close enough is cached."""
+        key = (kind, corpus_version, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._is_expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    return copy.deepcopy(entry[0])
+                del self._entries[key]
+            signature = question_signature(question)
+            has_candidates = any(
+                k[:2] == key[:2] and e[2] is not None and e[3] == signature for k, e in self._entries.items()
+            )
+
+        if not (semantic and self.similarity_threshold and has_candidates):
+            return None
+
+        query_vector = self._embed(question)
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            for cached_key, (value, created_at, vector, cached_signature) in list(self._entries.items()):
+                if cached_key[:2] != key[:2] or vector is None or cached_signature != signature:
+                    continue
+                if self._is_expired(created_at, now):
+                    del self._entries[cached_key]
+                    continue
+                score = float(query_vector @ vector)
+                if score >= best_score:
+                    best_key, best_score = cached_key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            logger.info(f"Answer cache matched a similar question (similarity {best_score:.3f}).")
+            return copy.deepcopy(self._entries[best_key][0])
+
+    def put(self, kind, question, corpus_version, value, semantic=True):
+        key = (kind, corpus_version, normalize_question(question))
+        vector = self._embed(question) if semantic and self.similarity_threshold else None
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(value), time.time(), vector, question_signature(question))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._query_embeddings.clear()
+
+# Shared by the chatbot and the summarizer
+ANSWER_CACHE = AnswerCache()
@@ -0,0 +1,145 @@
+# batch_qa.py
+
+"""
+Answer a file of questions against one case and write the answers with their sources as JSONL.
+
+    python batch_qa.py questions.jsonl answers.jsonl [--document-path docs/law-data/case2]
+
+Questions are read from JSONL ({"id": ..., "question": ...} per line) or CSV (with "id" and
+"question" columns); the id is optional and defaults to the line number. Answers are appended
+to the output as they complete, so an interrupted job picks up where it stopped when rerun.
+"""
+
+import os
+import csv
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from corpus import get_corpus
+from chatbot import answer_question
+from llm_interface import LLM_ERROR_MESSAGE
+from summarizer import refine_question
+from retrieval import batch_hybrid_retrieve
+from tracing import trace, export_metrics
+from config import DOCUMENT_PATH, LLM_CONCURRENCY
+from logging_config import logger
+
+def read_questions(path):
+    """Return (id, question) pairs from a JSONL or CSV file. Rows repeating an earlier id are skipped."""
+    questions = []
+    seen = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    for index, row in enumerate(rows, start=1):
+        question = (row.get("question") or "").strip()
+        if not question:
+            continue
+        question_id = str(row.get("id") or index)
+        if question_id in seen:
+            # Answers are matched to questions by id, so only the first one can be answered
+            logger.warning(f"Skipping row {index}: id {question_id} is already used by an earlier question")
+            continue
+        seen.add(question_id)
+        questions.append((question_id, question))
+    return questions
+
+def read_answered_ids(path):
+    """Ids already written to the output file; a partly written last line is ignored."""
+    answered = set()
+    if not os.path.exists(path):
+        return answered
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                answered.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                continue
+    return answered
+
+def refine_one(question_id, question):
+    """The refined question; raises if the LLM call failed, so the question is retried on the next run."""
+    with trace("batch_refine", question_id=question_id):
+        refined_question = refine_question(question)
+    if LLM_ERROR_MESSAGE in refined_question:
+        raise RuntimeError("question refinement failed")
+    return refined_question
+
+def answer_one(question_id, question, asked_question, documents, vector_store, retrieved_docs):
+    """
+    Answer asked_question (the question itself, or its refinement) with the documents retrieved for it.
+    Raises if the LLM call failed, so nothing is written and the question is retried on the next run.
+    """
+    with trace("batch_qa", question_id=question_id):
+        result = answer_question(asked_question, documents, vector_store, retrieved_docs=retrieved_docs)
+    if LLM_ERROR_MESSAGE in result["answer"]:
+        raise RuntimeError("the LLM call failed")
+    return {
+        "id": question_id,
+        "question": question,
+        "refined_question": asked_question if asked_question != question else None,
+        "answer": result["answer"],
+        "sources": [
+            {"file_name": item["file_name"], "page_number": item["page_number"]}
+            for item in result["structured_context"]
+        ]
+    }
+
+def run_batch(input_path, output_path, document_path=DOCUMENT_PATH, concurrency=LLM_CONCURRENCY, refine=False):
+    questions = read_questions(input_path)
+    answered = read_answered_ids(output_path)
+    pending = [(qid, question) for qid, question in questions if qid not in answered]
+    logger.info(f"{len(questions)} questions, {len(questions) - len(pending)} already answered, {len(pending)} to go")
+    if not pending:
+        return 0
+
+    corpus = get_corpus(document_path)
+    completed = 0
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Questions are refined before retrieval, so the chunks match the question that is answered
+        asked = {}
+        if refine:
+            refinements = {executor.submit(refine_one, qid, question): qid for qid, question in pending}
+            for future in as_completed(refinements):
+                try:
+                    asked[refinements[future]] = future.result()
+                except Exception as e:
+                    logger.error(f"Question {refinements[future]} failed: {str(e)}")
+            pending = [(qid, question) for qid, question in pending if qid in asked]
+        else:
+            asked = dict(pending)
+
+        # Retrieval for the whole batch up front, with one embedding call for all questions
+        retrieved = batch_hybrid_retrieve([asked[qid] for qid, _ in pending], corpus.documents, corpus.vector_store) if pending else []
+        futures = {
+            executor.submit(answer_one, qid, question, asked[qid], corpus.documents, corpus.vector_store, docs): qid
+            for (qid, question), docs in zip(pending, retrieved)
+        }
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # Left out of the output so the question is retried on the next run
+                logger.error(f"Question {futures[future]} failed: {str(e)}")
+                continue
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            completed += 1
+            logger.info(f"Answered {completed}/{len(pending)} (id {record['id']})")
+    export_metrics()
+    return completed
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions against a case.")
+    parser.add_argument("input", help="Questions as JSONL or CSV")
+    parser.add_argument("output", help="Answers JSONL; existing answers are kept and skipped")
+    parser.add_argument("--document-path", default=DOCUMENT_PATH)
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY, help="Concurrent LLM calls")
+    parser.add_argument("--refine", action="store_true", help="Refine each question with the LLM first")
+    args = parser.parse_args()
+    run_batch(args.input, args.output, args.document_path, args.concurrency, args.refine)
+
+if __name__ == "__main__":
+    main()
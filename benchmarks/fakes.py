@@ -0,0 +1,86 @@
+# benchmarks/fakes.py
+
+"""
+Local stand-ins for Ollama and the embedding model, so the pipeline can be timed without
+either. Both are deterministic: the same prompt or text always gives the same output.
+Install them with llm_interface.set_llm and retrieval.set_embedding_function.
+"""
+
+import re
+import time
+import zlib
+import random
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+VOCABULARY = ("the court plaintiff defendant agreement motion judgment claim evidence record damages "
+              "contract notice filed order finds liability party counsel testimony exhibit delivery").split()
+
+class FakeMessage:
+    """The parts of a langchain message the pipeline reads."""
+
+    def __init__(self, content, usage_metadata=None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+class FakeChatModel:
+    """
+    Chat model with a fixed time to first token (latency, seconds) and generation speed
+    (tokens_per_second). Replies are output_tokens words picked from a hash of the prompt.
+    """
+
+    def __init__(self, latency=0.2, tokens_per_second=40.0, output_tokens=80):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+
+    def _reply(self, prompt):
+        seed = int.from_bytes(hashlib.sha256(str(prompt).encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        return [rng.choice(VOCABULARY) for _ in range(self.output_tokens)]
+
+    def _usage(self, prompt, words):
+        # Roughly what a tokenizer would report, without loading one
+        return {"input_tokens": len(str(prompt).split()), "output_tokens": len(words)}
+
+    def invoke(self, prompt, **kwargs):
+        words = self._reply(prompt)
+        time.sleep(self.latency + len(words) / self.tokens_per_second)
+        return FakeMessage(" ".join(words), self._usage(prompt, words))
+
+    def stream(self, prompt, **kwargs):
+        words = self._reply(prompt)
+        time.sleep(self.latency)
+        for index, word in enumerate(words):
+            time.sleep(1.0 / self.tokens_per_second)
+            yield FakeMessage(word if index == 0 else f" {word}")
+        yield FakeMessage("", self._usage(prompt, words))
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words vectors: cheap, deterministic, and similar for texts that share
+    words, so retrieval results are still meaningful. seconds_per_text simulates model time.
+    """
+
+    def __init__(self, dimensions=256, seconds_per_text=0.0):
+        self.dimensions = dimensions
+        self.seconds_per_text = seconds_per_text
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            bucket = zlib.crc32(token.encode("utf-8"))
+            vector[bucket % self.dimensions] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.seconds_per_text:
+            time.sleep(self.seconds_per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
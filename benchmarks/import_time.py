@@ -0,0 +1,44 @@
+# benchmarks/import_time.py
+
+"""
+Check that importing the application modules stays within the startup budget and does not
+pull in the embedding model stack. Run from the repository root:
+
+    python -m benchmarks.import_time
+"""
+
+import json
+import subprocess
+import sys
+
+from config import IMPORT_TIME_BUDGET_SECONDS
+
+MODULES = ["main", "chatbot", "summarizer", "document_processing", "retrieval"]
+
+# Modules that should only be imported once an embedding or vector search is needed
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "langchain_huggingface", "chromadb"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy_modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure_import_time(modules=MODULES):
+    """Import the modules in a fresh interpreter and return the elapsed time and heavy modules loaded."""
+    probe = _PROBE.format(modules=list(modules), heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    result = measure_import_time()
+    result["budget_seconds"] = IMPORT_TIME_BUDGET_SECONDS
+    result["ok"] = result["seconds"] <= IMPORT_TIME_BUDGET_SECONDS and not result["heavy_modules"]
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
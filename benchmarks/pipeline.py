@@ -0,0 +1,189 @@
+# benchmarks/pipeline.py
+
+"""
+Time ingestion, retrieval, Q&A and case summaries on synthetic case files, with local
+stand-ins for Ollama and the embedding model, across corpus sizes and concurrency levels.
+Run from the repository root:
+
+    python -m benchmarks.pipeline --sizes 5,20,50 --concurrency 1,4 --output bench.json
+
+Results are written as JSON: one record per (corpus size, stage, concurrency) with call
+count, wall time, throughput and p50/p95/mean latencies, plus the per-stage span metrics of
+each corpus size. Compare two result files from before and after a change.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.synthetic_corpus import generate_case
+from document_processing import load_documents_from_directory
+from retrieval import load_or_create_vector_store, get_hybrid_retriever, get_store_paths, set_embedding_function
+from embedding_cache import get_cached_embeddings
+from llm_interface import set_llm
+from chatbot import answer_question
+from summarizer import summarize_case
+from tracing import METRICS, percentile
+from config import INGEST_WORKERS
+
+def latency_summary(latencies):
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "mean_ms": round(sum(values) / len(values), 3)
+    }
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def run_concurrently(func, items, concurrency):
+    """Call func on every item with concurrency threads; returns per-call latencies and wall time."""
+    def call(item):
+        return timed(func, item)[1]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, items))
+    return latencies, time.perf_counter() - start
+
+def pick_questions(questions, count):
+    """Evenly spaced questions, so every part of the corpus is asked about."""
+    if count >= len(questions):
+        return [item["question"] for item in questions]
+    step = len(questions) / count
+    return [questions[int(i * step)]["question"] for i in range(count)]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_size(files, args, work_dir):
+    """Run every stage on one generated corpus. Returns the result records and the span metrics."""
+    case = generate_case(os.path.join(work_dir, f"case-{files}"), files=files, pages_per_file=args.pages, seed=args.seed)
+    paths = get_store_paths(os.path.join(work_dir, f"store-{files}"))
+    # Start from an empty store so the first ingest is really cold, also when --work-dir is reused
+    for directory in (paths["persist_directory"], paths["numpy_directory"]):
+        shutil.rmtree(directory, ignore_errors=True)
+    for key in ("bm25_index_path", "manifest_path", "metadata_index_path"):
+        if os.path.exists(paths[key]):
+            os.remove(paths[key])
+    METRICS.reset()
+    records = []
+
+    def record(stage, latencies, wall, concurrency=1, **extra):
+        records.append(dict(
+            {"files": files, "pages": files * args.pages, "stage": stage, "concurrency": concurrency,
+             "calls": len(latencies), "wall_s": round(wall, 4),
+             "throughput_per_s": round(len(latencies) / wall, 3) if wall > 0 else None},
+            **latency_summary(latencies), **extra
+        ))
+
+    # Ingestion: parsing, then a cold and a warm (nothing changed) vector store sync
+    documents, elapsed = timed(load_documents_from_directory, case["path"], num_workers=args.ingest_workers)
+    record("load_documents", [elapsed], elapsed, chunks=len(documents))
+    vector_store, elapsed = timed(load_or_create_vector_store, documents, paths)
+    record("ingest_cold", [elapsed], elapsed, chunks=len(documents))
+    vector_store, elapsed = timed(load_or_create_vector_store, documents, paths)
+    record("ingest_warm", [elapsed], elapsed, chunks=len(documents))
+
+    retriever = get_hybrid_retriever(documents, vector_store, bm25_index_path=paths["bm25_index_path"])
+    questions = pick_questions(case["questions"], args.questions)
+    summary_questions = questions[:args.summary_questions]
+
+    def answer(question):
+        # Retrieval is done here, with this corpus' BM25 index, and passed in
+        docs = retriever.get_relevant_documents(question)
+        return answer_question(question, documents, vector_store, use_cache=False, retrieved_docs=docs,
+                               corpus_version="benchmark", metadata_index_path=None)
+
+    def summarize(question):
+        return summarize_case(question, documents, vector_store, use_cache=False, retriever=retriever,
+                              corpus_version="benchmark")
+
+    for concurrency in args.concurrency:
+        latencies, wall = run_concurrently(retriever.get_relevant_documents, questions, concurrency)
+        record("retrieve", latencies, wall, concurrency)
+        latencies, wall = run_concurrently(answer, questions, concurrency)
+        record("answer_question", latencies, wall, concurrency)
+        if summary_questions:
+            latencies, wall = run_concurrently(summarize, summary_questions, concurrency)
+            record("summarize_case", latencies, wall, concurrency)
+    return records, METRICS.snapshot()
+
+def parse_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic case files with a fake LLM and embeddings.")
+    parser.add_argument("--sizes", type=parse_list, default=[5, 20], help="Comma-separated numbers of PDFs per corpus")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per PDF")
+    parser.add_argument("--concurrency", type=parse_list, default=[1, 4], help="Comma-separated concurrency levels")
+    parser.add_argument("--questions", type=int, default=20, help="Questions per Q&A and retrieval run")
+    parser.add_argument("--summary-questions", type=int, default=4, help="Requests per summary run")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM time to first token, seconds")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Fake LLM output tokens per second")
+    parser.add_argument("--output-tokens", type=int, default=80, help="Fake LLM tokens per reply")
+    parser.add_argument("--embedding-dimensions", type=int, default=256)
+    parser.add_argument("--embedding-seconds", type=float, default=0.0, help="Simulated embedding time per text")
+    parser.add_argument("--embedding-cache", action="store_true", help="Put the on-disk embedding cache in front of the fake model")
+    parser.add_argument("--ingest-workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Where corpora and stores are written; a temporary folder by default")
+    parser.add_argument("--output", help="Results JSON file; printed to stdout if omitted")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="legal-bench-")
+    embeddings = FakeEmbeddings(args.embedding_dimensions, args.embedding_seconds)
+    if args.embedding_cache:
+        embeddings = get_cached_embeddings(embeddings, cache_dir=os.path.join(work_dir, "embedding-cache"), model_name="fake")
+    set_embedding_function(embeddings)
+    set_llm(FakeChatModel(args.llm_latency, args.token_rate, args.output_tokens))
+
+    report = {
+        "run": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "work_dir")}
+        },
+        "results": [],
+        "stage_metrics": {}
+    }
+    try:
+        for files in args.sizes:
+            records, metrics = benchmark_size(files, args, work_dir)
+            report["results"].extend(records)
+            report["stage_metrics"][str(files)] = metrics
+            for item in records:
+                print(f"{item['files']:>5} files  {item['stage']:<16} x{item['concurrency']:<3} "
+                      f"p50 {item['p50_ms']:>10.1f} ms  p95 {item['p95_ms']:>10.1f} ms", file=sys.stderr)
+    finally:
+        set_llm(None)
+        set_embedding_function(None)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
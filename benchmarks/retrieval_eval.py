@@ -0,0 +1,214 @@
+# benchmarks/retrieval_eval.py
+
+"""
+Offline retrieval evaluation: sweep chunking and retriever settings over labeled questions and
+report recall@k and MRR next to p50/p95 retrieval latency and prompt tokens per question.
+Run from the repository root:
+
+    python -m benchmarks.retrieval_eval labels.jsonl --document-path docs/law-data/case2 \\
+        --chunk-sizes 512,1024 --overlaps 100,200 --k 5,10 --weights 0.8:0.2,0.5:0.5
+
+Labels are JSONL, one question per line, with the pages that answer it:
+
+    {"question": "When was the complaint filed?", "expected": [{"source": "complaint.pdf", "page": 0}]}
+
+Sources match on the file name, and a missing or null page matches any page of the file.
+Without a labels file, --synthetic N evaluates on a generated case of N PDFs whose questions
+are labeled by construction (use --fake-embeddings to skip the embedding model as well).
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import itertools
+from benchmarks.synthetic_corpus import generate_case
+from document_processing import list_pdf_files, load_pdf_pages, split_and_preprocess
+from retrieval import load_or_create_vector_store, get_hybrid_retriever, get_store_paths, set_embedding_function
+from context_packing import pack_context, count_tokens
+from utils import prepare_context, format_context
+from tracing import percentile
+
+def read_labels(path):
+    """(question, expected) pairs, expected being a list of (file name, page or None)."""
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            expected = row.get("expected") or [{"source": row["source"], "page": row.get("page")}]
+            labels.append((row["question"], [(os.path.basename(str(item["source"])), item.get("page")) for item in expected]))
+    return labels
+
+def load_pages(document_path):
+    """Unsplit pages of a PDF folder or markdown file, so every chunk setting starts from the same text."""
+    if document_path.endswith(".md"):
+        from langchain_community.document_loaders import UnstructuredMarkdownLoader
+        return UnstructuredMarkdownLoader(document_path).load()
+    return [page for file_path in list_pdf_files(document_path) for page in load_pdf_pages(file_path)]
+
+def is_match(doc, expected):
+    source = os.path.basename(str(doc.metadata.get("source", "")))
+    page = doc.metadata.get("page")
+    return any(source == exp_source and (exp_page is None or page == exp_page) for exp_source, exp_page in expected)
+
+def score_question(docs, expected, k):
+    """Recall@k over the expected pages and reciprocal rank of the first relevant chunk."""
+    top = docs[:k]
+    found = {
+        (exp_source, exp_page) for exp_source, exp_page in expected
+        if any(is_match(doc, [(exp_source, exp_page)]) for doc in top)
+    }
+    rank = next((position for position, doc in enumerate(top, start=1) if is_match(doc, expected)), None)
+    return len(found) / len(expected), 1.0 / rank if rank else 0.0
+
+def prompt_tokens(docs):
+    """Context tokens the retrieved chunks would cost in the prompt, after packing."""
+    return count_tokens(format_context(pack_context(prepare_context(docs))))
+
+def evaluate(retriever, labels, k):
+    recalls, reciprocal_ranks, latencies, tokens = [], [], [], []
+    for question, expected in labels:
+        start = time.perf_counter()
+        docs = retriever.get_relevant_documents(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recall, reciprocal_rank = score_question(docs, expected, k)
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        tokens.append(prompt_tokens(docs[:k]))
+    latencies.sort()
+    return {
+        "recall_at_k": round(sum(recalls) / len(recalls), 4),
+        "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "prompt_tokens_mean": round(sum(tokens) / len(tokens), 1)
+    }
+
+def sweep(document_path, labels, grid, work_dir):
+    """Evaluate every combination in the grid; chunking is done once per chunk setting."""
+    pages = load_pages(document_path)
+    results = []
+    for chunk_size, overlap in itertools.product(grid["chunk_sizes"], grid["overlaps"]):
+        if overlap >= chunk_size:
+            continue
+        documents = split_and_preprocess(pages, chunk_size, overlap)
+        paths = get_store_paths(os.path.join(work_dir, f"chunks-{chunk_size}-{overlap}"))
+        vector_store = load_or_create_vector_store(documents, paths)
+        for k, weights, strategy, dedup, mmr_lambda in itertools.product(
+            grid["k"], grid["weights"], grid["strategies"], grid["dedup"], grid["mmr"]
+        ):
+            retriever = get_hybrid_retriever(
+                documents, vector_store, bm25_index_path=paths["bm25_index_path"],
+                k=k, weights=weights, strategy=strategy, dedup=dedup, mmr_lambda=mmr_lambda
+            )
+            config = {
+                "chunk_size": chunk_size, "chunk_overlap": overlap, "chunks": len(documents), "k": k,
+                "weights": list(weights) if weights else "by question type",
+                "strategy": strategy, "dedup": dedup, "mmr_lambda": mmr_lambda
+            }
+            result = dict(config, **evaluate(retriever, labels, k))
+            results.append(result)
+            print(f"size {chunk_size:>5} overlap {overlap:>4} k {k:>3} weights {str(config['weights']):<16} "
+                  f"{strategy:<8} dedup {str(dedup):<5} mmr {str(mmr_lambda):<5} "
+                  f"recall {result['recall_at_k']:.3f} mrr {result['mrr']:.3f} "
+                  f"p95 {result['p95_ms']:>8.1f} ms tokens {result['prompt_tokens_mean']:>7.1f}", file=sys.stderr)
+    return results
+
+def cheapest(results, max_recall_drop):
+    """Fewest prompt tokens among the configurations within max_recall_drop of the best recall."""
+    if not results:
+        return None
+    best_recall = max(result["recall_at_k"] for result in results)
+    eligible = [result for result in results if result["recall_at_k"] >= best_recall - max_recall_drop]
+    return min(eligible, key=lambda result: (result["prompt_tokens_mean"], result["p95_ms"]))
+
+def parse_ints(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+def parse_weights(text):
+    """'0.8:0.2,0.5:0.5' -> [(0.8, 0.2), (0.5, 0.5)]; 'auto' picks weights by question type."""
+    weights = []
+    for value in text.split(","):
+        value = value.strip()
+        if value == "auto":
+            weights.append(None)
+        elif value:
+            keyword, vector = value.split(":")
+            weights.append((float(keyword), float(vector)))
+    return weights
+
+def parse_mmr(text):
+    return [None if value.strip() == "none" else float(value) for value in text.split(",") if value.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retriever settings and report recall@k, MRR, latency and prompt tokens.")
+    parser.add_argument("labels", nargs="?", help="Labeled questions as JSONL")
+    parser.add_argument("--document-path", help="Case folder (PDFs) or markdown file the labels refer to")
+    parser.add_argument("--synthetic", type=int, help="Evaluate on a generated case with this many PDFs instead")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per generated PDF")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Use hashed bag-of-words embeddings instead of the model")
+    parser.add_argument("--chunk-sizes", type=parse_ints, default=[512, 1024])
+    parser.add_argument("--overlaps", type=parse_ints, default=[100, 200])
+    parser.add_argument("--k", type=parse_ints, default=[5, 10])
+    parser.add_argument("--weights", type=parse_weights, default=[(0.8, 0.2), None])
+    parser.add_argument("--strategies", default="rrf", help="Comma-separated: rrf, weighted")
+    parser.add_argument("--dedup", default="true", help="Comma-separated: true, false")
+    parser.add_argument("--mmr", type=parse_mmr, default=[None], help="Comma-separated MMR lambdas, or none")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02, help="Recall the recommended configuration may give up")
+    parser.add_argument("--work-dir", help="Where the per-setting stores are written; a temporary folder by default")
+    parser.add_argument("--output", help="Results JSON file; printed to stdout if omitted")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="legal-eval-")
+    if args.fake_embeddings:
+        from benchmarks.fakes import FakeEmbeddings
+        set_embedding_function(FakeEmbeddings())
+    try:
+        if args.synthetic:
+            case = generate_case(os.path.join(work_dir, "case"), files=args.synthetic, pages_per_file=args.pages)
+            document_path = case["path"]
+            labels = [(item["question"], [(os.path.basename(item["source"]), item["page"])]) for item in case["questions"]]
+        elif args.labels and args.document_path:
+            document_path = args.document_path
+            labels = read_labels(args.labels)
+        else:
+            parser.error("Pass a labels file with --document-path, or --synthetic N")
+        if not labels:
+            parser.error("No labeled questions to evaluate")
+
+        grid = {
+            "chunk_sizes": args.chunk_sizes,
+            "overlaps": args.overlaps,
+            "k": args.k,
+            "weights": args.weights,
+            "strategies": [value.strip() for value in args.strategies.split(",") if value.strip()],
+            "dedup": [value.strip().lower() == "true" for value in args.dedup.split(",") if value.strip()],
+            "mmr": args.mmr
+        }
+        results = sweep(document_path, labels, grid, work_dir)
+    finally:
+        if args.fake_embeddings:
+            set_embedding_function(None)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "document_path": args.document_path or f"synthetic ({args.synthetic} PDFs)",
+        "questions": len(labels),
+        "results": results,
+        "recommended": cheapest(results, args.max_recall_drop)
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# benchmarks/synthetic_corpus.py
+
+"""
+Generate a synthetic legal case file of configurable size, as PDFs or one markdown file.
+
+    python -m benchmarks.synthetic_corpus out/case --files 20 --pages 5 [--format md] [--seed 0]
+
+The text is deterministic for a given seed. Besides the files, generate_case returns the case
+facts (name, number, court, dates, parties) and one question per page whose answer sits on
+that page only, so retrieval can be scored against known sources.
+"""
+
+import os
+import json
+import random
+import argparse
+
+SURNAMES = ["Harper", "Okafor", "Lindqvist", "Moreno", "Castellano", "Whitfield", "Nakamura", "Brennan",
+            "Adeyemi", "Kowalski", "Delacroix", "Thornbury", "Vasquez", "Abernathy", "Iverson", "Mbeki"]
+COMPANIES = ["Northgate Logistics", "Bluewater Holdings", "Crestline Medical", "Ironwood Builders",
+             "Summit Ridge Insurance", "Pioneer Freight", "Redstone Capital", "Meridian Foods"]
+COUNTIES = ["Franklin", "Marion", "Jefferson", "Hamilton", "Lake", "Clark", "Greene", "Warren"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+          "October", "November", "December"]
+FILINGS = ["Complaint", "Answer and Counterclaim", "Motion for Summary Judgment", "Memorandum in Opposition",
+           "Deposition Transcript", "Expert Report", "Order on Motions", "Opinion and Judgment"]
+CLAIMS = ["breach of contract", "negligence", "fraudulent misrepresentation", "unjust enrichment",
+          "breach of warranty", "tortious interference", "promissory estoppel", "conversion"]
+SENTENCES = [
+    "The {party} contends that the {claim} claim fails as a matter of law because the record shows no genuine dispute of material fact.",
+    "Under the governing standard, the court views the evidence in the light most favorable to the non-moving party.",
+    "The agreement dated {date} required delivery of the goods within thirty days of the purchase order.",
+    "Witness testimony established that the {party} received written notice of the defect on {date}.",
+    "The damages sought include lost profits, incidental costs and reasonable attorney fees under section {section} of the agreement.",
+    "Counsel for the {party} argued that the limitation of liability clause bars recovery of consequential damages.",
+    "The court finds that the {claim} claim is supported by the invoices, correspondence and inspection reports in the record.",
+    "Discovery closed on {date}, and neither party moved to extend the deadline or compel further production.",
+    "The {party} failed to mitigate its losses after learning of the shipment delays in the spring.",
+    "Pursuant to Rule {rule}, the motion is decided on the written submissions without oral argument.",
+    "The expert opined that the structural failure resulted from deviations from the approved specifications.",
+    "The record reflects repeated assurances by the {party} that performance would be completed on schedule.",
+]
+LINE_WIDTH = 90
+LINES_PER_PAGE = 52
+
+def random_date(rng, start_year=2016, end_year=2023):
+    return f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(start_year, end_year)}"
+
+def case_facts(rng):
+    plaintiff = f"{rng.choice(SURNAMES)} {rng.choice(['Industries', 'Partners', 'Group', 'Supply'])}"
+    defendant = rng.choice(COMPANIES)
+    filed_year = rng.randint(2016, 2021)
+    return {
+        "case_name": f"{plaintiff.split()[0]} v. {defendant.split()[0]}",
+        "case_number": f"{filed_year}-CV-{rng.randint(1000, 99999):05d}",
+        "court": f"District Court of {rng.choice(COUNTIES)} County",
+        "filed": f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {filed_year}",
+        "decided": f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {filed_year + rng.randint(1, 2)}",
+        "plaintiff": plaintiff,
+        "defendant": defendant,
+        "claim": rng.choice(CLAIMS)
+    }
+
+def page_lines(rng, facts, filing, page_number, marker):
+    """Text lines of one page: a header, filler paragraphs and one sentence only this page has."""
+    lines = [
+        f"{facts['court'].upper()}",
+        f"{facts['plaintiff']}, Plaintiff, v. {facts['defendant']}, Defendant.",
+        f"Case No. {facts['case_number']} - {filing} - Page {page_number + 1}",
+        ""
+    ]
+    if page_number == 0:
+        lines.append(f"This action was filed on {facts['filed']} and alleges {facts['claim']}.")
+        if filing == "Opinion and Judgment":
+            lines.append(f"This opinion was decided on {facts['decided']} by the {facts['court']}.")
+    words = []
+    for _ in range(rng.randint(14, 20)):
+        words.extend(rng.choice(SENTENCES).format(
+            party=rng.choice(["plaintiff", "defendant"]),
+            claim=facts["claim"],
+            date=random_date(rng),
+            section=f"{rng.randint(1, 12)}.{rng.randint(1, 9)}",
+            rule=rng.choice(["56", "12(b)(6)", "37", "26"])
+        ).split())
+    # The page-unique fact sits in the middle of the page's text
+    middle = len(words) // 2
+    words[middle:middle] = marker.split()
+
+    line = ""
+    for word in words:
+        if len(line) + len(word) + 1 > LINE_WIDTH:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    lines.append(line)
+    return lines[:LINES_PER_PAGE]
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one Helvetica text page per list of lines."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(output)
+
+def generate_case(output_dir, files=5, pages_per_file=4, seed=0, fmt="pdf"):
+    """
+    Write a synthetic case file to output_dir (PDFs) or output_dir + '.md' (markdown).
+    Returns {"path", "files", "facts", "questions"}, where each question carries the source
+    file and 0-based page its answer is on.
+    """
+    rng = random.Random(seed)
+    facts = case_facts(rng)
+    questions = []
+    documents = []
+    for file_number in range(files):
+        filing = FILINGS[file_number % len(FILINGS)]
+        name = f"{file_number + 1:03d}-{filing.lower().replace(' ', '-')}"
+        pages = []
+        for page_number in range(pages_per_file):
+            exhibit = f"EX-{seed}-{file_number + 1}-{page_number + 1}"
+            item = rng.choice(["a shipping manifest", "a signed change order", "an inspection photograph",
+                               "a wire transfer record", "an email from the project manager", "a warehouse log"])
+            amount = rng.randint(1000, 999999)
+            marker = f"Exhibit {exhibit} is {item} showing a disputed amount of ${amount:,}."
+            pages.append(page_lines(rng, facts, filing, page_number, marker))
+            questions.append({
+                "question": f"What does Exhibit {exhibit} show?",
+                "answer": f"{item}, ${amount:,}",
+                "file": name,
+                "page": page_number
+            })
+        documents.append((name, pages))
+
+    if fmt == "md":
+        path = f"{output_dir.rstrip(os.sep)}.md"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for name, pages in documents:
+                f.write(f"# {name}\n\n")
+                for lines in pages:
+                    f.write("\n".join(lines) + "\n\n")
+        written = [path]
+        # Markdown has no pages, only the file can be checked
+        for question in questions:
+            question["source"] = path
+            question["page"] = None
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        written = []
+        for name, pages in documents:
+            path = os.path.join(output_dir, f"{name}.pdf")
+            write_pdf(path, pages)
+            written.append(path)
+        for question in questions:
+            question["source"] = os.path.join(output_dir, f"{question['file']}.pdf")
+        path = output_dir
+    return {"path": path, "files": written, "facts": facts, "questions": questions}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic legal case file.")
+    parser.add_argument("output", help="Folder for the PDFs, or path (without .md) for markdown")
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=4, help="Pages per file")
+    parser.add_argument("--format", choices=["pdf", "md"], default="pdf")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    case = generate_case(args.output, args.files, args.pages, args.seed, args.format)
+    print(json.dumps({"path": case["path"], "files": len(case["files"]), "facts": case["facts"]}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# case_metadata.py
+
+import os
+import re
+import json
+import threading
+from collections import Counter
+from config import METADATA_INDEX_PATH
+from logging_config import logger
+
+MONTHS = r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\.?"
+YEAR = r"(?:19|20)\d{2}"
+YEAR_PATTERN = re.compile(rf"\b{YEAR}\b")
+# One word of a party name. A word ending in a period only counts if it is an abbreviation or an
+# initial, so a name never runs on across the end of a sentence ("Houston. John Smith, Appellant").
+NAME_WORD = r"(?:(?:Inc|Corp|Co|Ltd|LLC|Jr|Sr|Bros|Mr|Mrs|Ms|Dr|St)\.|(?:[A-Z]\.)+|[A-Z][A-Za-z&']*(?![\w.]))"
+
+# All metadata is found in a single pass over each chunk with one alternation of named groups.
+# Full dates come before bare years so a year inside a date is not matched twice.
+METADATA_PATTERN = re.compile(
+    r"(?P<case_name>\b[A-Z][a-zA-Z]*\s+v\.\s+[A-Z][a-zA-Z]*)"
+    r"|(?P<case_number>\bNo\.\s*[\w\-–]*\d[\w\-–]*)"
+    r"|(?P<court>(?i:\b(?:Court of Appeals|District Court|Supreme Court|Circuit Court|Family Court|Tribunal))\s+of\s+[A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)"
+    rf"|(?P<date>\b{MONTHS}\s+\d{{1,2}},?\s+{YEAR}\b|\b\d{{1,2}}\s+{MONTHS}\s+{YEAR}\b|\b\d{{1,2}}/\d{{1,2}}/{YEAR}\b|\b{YEAR}-\d{{2}}-\d{{2}}\b)"
+    rf"|(?P<party>\b{NAME_WORD}(?:\s+{NAME_WORD}){{0,5}}),\s+(?P<role>Appellants?|Appellees?|Plaintiffs?|Defendants?|Petitioners?|Respondents?|Relators?)\b"
+    rf"|(?P<year>\b{YEAR}\b)"
+)
+
+# Words shortly before a date that tell what the date is
+DATE_CONTEXTS = [
+    ("filed", re.compile(r"\b(?:filed|filing|submitted)\b", re.IGNORECASE)),
+    ("decided", re.compile(r"\b(?:decided|delivered|issued|rendered|opinion|judgment)\b", re.IGNORECASE)),
+    ("heard", re.compile(r"\b(?:heard|argued|hearing|trial)\b", re.IGNORECASE)),
+]
+DATE_CONTEXT_CHARS = 80
+
+def date_context(text, start):
+    """Label a date by the nearest keyword in the text just before it."""
+    window = text[max(0, start - DATE_CONTEXT_CHARS):start]
+    best_label, best_position = "other", -1
+    for label, pattern in DATE_CONTEXTS:
+        for match in pattern.finditer(window):
+            if match.start() > best_position:
+                best_label, best_position = label, match.start()
+    return best_label
+
+def extract_chunk_metadata(text):
+    """
+    Case names, numbers, courts, dates with their context, parties and years found in one chunk.
+
+    >>> extract_chunk_metadata("Court of Appeals of Texas, Houston. John Smith, Appellant")["parties"]
+    [{'name': 'John Smith', 'role': 'Appellant'}]
+    >>> extract_chunk_metadata("The court ruled for Jane Roe. Mary Major, Respondent")["parties"]
+    [{'name': 'Mary Major', 'role': 'Respondent'}]
+    >>> extract_chunk_metadata("Acme Holdings Co., Appellee, and John Q. Public, Appellant")["parties"]
+    [{'name': 'Acme Holdings Co.', 'role': 'Appellee'}, {'name': 'John Q. Public', 'role': 'Appellant'}]
+    """
+    metadata = {"case_names": [], "case_numbers": [], "courts": [], "dates": [], "parties": [], "years": []}
+    for match in METADATA_PATTERN.finditer(text):
+        kind = match.lastgroup
+        value = " ".join(match.group(0).split())
+        if kind == "case_name":
+            metadata["case_names"].append(value)
+        elif kind == "case_number":
+            metadata["case_numbers"].append(re.sub(r"^No\.\s*", "", value))
+        elif kind == "court":
+            metadata["courts"].append(value)
+        elif kind == "date":
+            metadata["dates"].append({"date": value, "context": date_context(text, match.start())})
+            metadata["years"].append(YEAR_PATTERN.search(value).group(0))
+        elif kind == "role":
+            metadata["parties"].append({"name": " ".join(match.group("party").split()), "role": match.group("role")})
+        elif kind == "year":
+            metadata["years"].append(value)
+    return metadata
+
+def summarize_metadata(chunks):
+    """Case-level view of the chunk metadata: the most frequent names, numbers and courts, and dates by context."""
+    counters = {key: Counter() for key in ("case_names", "case_numbers", "courts")}
+    dates = {}
+    parties = {}
+    years = set()
+    for chunk in chunks:
+        for key, counter in counters.items():
+            counter.update(chunk[key])
+        for date in chunk["dates"]:
+            dates.setdefault(date["context"], [])
+            if date["date"] not in dates[date["context"]]:
+                dates[date["context"]].append(date["date"])
+        for party in chunk["parties"]:
+            parties.setdefault(party["name"], party["role"])
+        years.update(chunk["years"])
+    top = {key: counter.most_common(1)[0][0] if counter else None for key, counter in counters.items()}
+    return {
+        "case_name": top["case_names"],
+        "case_number": top["case_numbers"],
+        "court_name": top["courts"],
+        "year": min(years) if years else None,
+        "dates": dates,
+        "parties": [{"name": name, "role": role} for name, role in parties.items()]
+    }
+
+def build_metadata_index(documents, index_path=METADATA_INDEX_PATH):
+    """Extract metadata from every chunk at ingest time and save it next to the vector store."""
+    logger.info(f"Building case metadata index for {len(documents)} chunks in {index_path}")
+    chunks = []
+    for doc in documents:
+        chunk = extract_chunk_metadata(doc.page_content)
+        chunk["source"] = doc.metadata.get("source", "Unknown")
+        chunk["page"] = doc.metadata.get("page", "Unknown")
+        chunks.append(chunk)
+    index = {"case": summarize_metadata(chunks), "chunks": chunks}
+
+    if index_path:
+        index_dir = os.path.dirname(index_path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+        with _INDEX_LOCK:
+            _INDEXES[index_path] = index
+    return index
+
+# Loaded metadata indexes, keyed by path
+_INDEXES = {}
+_INDEX_LOCK = threading.Lock()
+
+def load_metadata_index(index_path=METADATA_INDEX_PATH):
+    """Return the saved metadata index, or None if it hasn't been built yet."""
+    with _INDEX_LOCK:
+        index = _INDEXES.get(index_path)
+        if index is None and os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            _INDEXES[index_path] = index
+    return index
+
+def unload_metadata_index(index_path=METADATA_INDEX_PATH):
+    with _INDEX_LOCK:
+        _INDEXES.pop(index_path, None)
+
+def _sources_for(index, key, value):
+    """Structured-context items for the chunks a value was found in."""
+    sources = []
+    for chunk in index["chunks"]:
+        values = chunk[key]
+        if key == "dates":
+            values = [date["date"] for date in values]
+        if value in values:
+            item = {"file_name": chunk["source"], "page_number": chunk["page"], "content": value}
+            if item not in sources:
+                sources.append(item)
+    return sources
+
+# Questions the index can answer, checked in order. Filing questions must be about the case
+# itself, so "when was the motion filed" still goes to the LLM.
+CASE_WORDS = r"(?:case|complaint|petition|suit|lawsuit|action|appeal)"
+# Date questions naming another filing ("when was the motion to dismiss the case filed?") are left to the LLM
+OTHER_FILINGS = re.compile(
+    r"\b(?:motions?|briefs?|reply|replies|responses?|memorand(?:um|a)|notices?|orders?|answers?|counterclaims?|"
+    r"affidavits?|declarations?|exhibits?|amend(?:ed|ment)|objections?|stipulations?|subpoenas?)\b",
+    re.IGNORECASE
+)
+DATE_ROUTES = ("filed", "decided", "heard")
+QUESTION_ROUTES = [
+    ("case_number", re.compile(r"\b(?:case|docket|cause)\s+(?:number|no\.?)\b", re.IGNORECASE)),
+    ("filed", re.compile(rf"\b(?:(?:when|what date|which date)\b.*\b{CASE_WORDS}\b.*\bfiled|filing date|date (?:it was |the {CASE_WORDS} was )?filed)\b", re.IGNORECASE)),
+    ("decided", re.compile(rf"\b(?:(?:when|what date|which date)\b.*\b{CASE_WORDS}\b.*\bdecided|decision date|date (?:it was |the {CASE_WORDS} was )?decided)\b", re.IGNORECASE)),
+    ("heard", re.compile(rf"\b(?:(?:when|what date|which date)\b.*\b{CASE_WORDS}\b.*\b(?:heard|argued)|hearing date)\b", re.IGNORECASE)),
+    ("court", re.compile(r"\b(?:which|what)\s+court\b|\bcourt name\b", re.IGNORECASE)),
+    ("parties", re.compile(r"\b(?:who are the parties|parties involved|who (?:is|was|are|were) the (?:plaintiffs?|defendants?|appellants?|appellees?|petitioners?|respondents?))\b", re.IGNORECASE)),
+    ("case_name", re.compile(r"\b(?:case name|name of the case|what is the case called)\b", re.IGNORECASE)),
+]
+
+def case_date(index, route):
+    """
+    The case's filing, decision or hearing date: the only date with that context, or else the only
+    one on the first pages (the captions). Other dates with the context are often those of motions
+    or briefs, so with several candidates and no single caption date there is no answer.
+    """
+    candidates = index["case"]["dates"].get(route) or []
+    if len(candidates) == 1:
+        return candidates[0]
+    caption_dates = []
+    for chunk in index["chunks"]:
+        if str(chunk["page"]) != "0":
+            continue
+        for date in chunk["dates"]:
+            if date["context"] == route and date["date"] not in caption_dates:
+                caption_dates.append(date["date"])
+    return caption_dates[0] if len(caption_dates) == 1 else None
+
+def answer_from_metadata(question, index_path=METADATA_INDEX_PATH):
+    """
+    Answer simple factual questions (case number, filing/decision/hearing dates, court, parties,
+    case name) straight from the metadata index. Returns a result shaped like answer_question's,
+    or None if the question needs the LLM or the index has no answer.
+    """
+    index = load_metadata_index(index_path) if index_path else None
+    if index is None:
+        return None
+    case = index["case"]
+    for route, pattern in QUESTION_ROUTES:
+        if not pattern.search(question):
+            continue
+        if route == "case_number" and case["case_number"]:
+            return {"answer": case["case_number"], "structured_context": _sources_for(index, "case_numbers", case["case_number"])}
+        if route in DATE_ROUTES:
+            date = case_date(index, route) if not OTHER_FILINGS.search(question) else None
+            if date is None:
+                return None
+            return {"answer": date, "structured_context": _sources_for(index, "dates", date)}
+        if route == "court" and case["court_name"]:
+            return {"answer": case["court_name"], "structured_context": _sources_for(index, "courts", case["court_name"])}
+        if route == "case_name" and case["case_name"]:
+            return {"answer": case["case_name"], "structured_context": _sources_for(index, "case_names", case["case_name"])}
+        if route == "parties" and case["parties"]:
+            answer = "; ".join(f"{party['name']} ({party['role']})" for party in case["parties"])
+            return {"answer": answer, "structured_context": []}
+        return None
+    return None
@@ -0,0 +1,219 @@
+# case_shards.py
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from corpus import Corpus
+from retrieval import get_store_paths, get_embedding_function, merge_retrieved_documents
+from fusion import fuse_rankings, dedup_documents, keyword_search, get_query_weights
+from summarizer import refine_question, summarize_case
+from chatbot import answer_question
+from config import (
+    CASES_DIRECTORY,
+    SHARDS_DIRECTORY,
+    MAX_RESIDENT_SHARDS,
+    COLLECTION_NAME,
+    FUSION_TOP_K,
+    FUSION_FETCH_K,
+    FUSION_DEDUP
+)
+from logging_config import logger
+
+class CaseShards:
+    """
+    An archive of cases, one shard per case. Each shard is a Corpus with its own vector store,
+    BM25 index, manifest and metadata index under SHARDS_DIRECTORY/<case>, so a query only
+    searches the cases it names and never returns chunks from other cases.
+    Shards are loaded on first use and at most max_resident are kept; the least recently used
+    one is unloaded when another is needed, or once the requests still using it are done.
+    """
+
+    def __init__(self, cases_directory=CASES_DIRECTORY, shards_directory=SHARDS_DIRECTORY, max_resident=MAX_RESIDENT_SHARDS):
+        self.cases_directory = cases_directory
+        self.shards_directory = shards_directory
+        self.max_resident = max(1, max_resident)
+        self._shards = OrderedDict()
+        self._loading = {}  # case -> Future of the shard being loaded
+        self._users = {}  # case -> requests using the shard
+        self._retired = {}  # Evicted shards still in use, unloaded when the last request is done
+        self._lock = threading.Lock()
+
+    def list_cases(self):
+        """Case names: the subfolders and markdown files of the cases directory."""
+        if not os.path.isdir(self.cases_directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.cases_directory)
+            if not name.startswith(".")
+            and (os.path.isdir(os.path.join(self.cases_directory, name)) or name.endswith(".md"))
+        )
+
+    def shard_paths(self, case):
+        return get_store_paths(os.path.join(self.shards_directory, case), collection_name=COLLECTION_NAME)
+
+    def _acquire(self, case):
+        """
+        Return the shard for a case and count the caller as a user until _release. A shard that
+        isn't loaded is loaded outside the lock, so queries to loaded shards aren't held up by it,
+        and concurrent requests for the same case wait for one load.
+        """
+        evicted = []
+        with self._lock:
+            shard = self._shards.get(case)
+            if shard is None and case in self._retired:
+                # Back among the resident shards, which may push another one out
+                shard = self._shards[case] = self._retired.pop(case)
+                evicted = self._evict()
+            if shard is not None:
+                self._shards.move_to_end(case)
+                self._users[case] = self._users.get(case, 0) + 1
+            else:
+                loading = self._loading.get(case)
+                owner = loading is None
+                if owner:
+                    if case not in self.list_cases():
+                        raise KeyError(f"Unknown case {case!r} in {self.cases_directory}")
+                    loading = self._loading[case] = Future()
+
+        if shard is not None:
+            self._unload(evicted)
+            return shard
+        if not owner:
+            loading.result()
+            return self._acquire(case)
+        try:
+            shard = Corpus.load(os.path.join(self.cases_directory, case), paths=self.shard_paths(case))
+        except BaseException as e:
+            with self._lock:
+                del self._loading[case]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[case]
+            self._shards[case] = shard
+            self._users[case] = self._users.get(case, 0) + 1
+            evicted = self._evict()
+        loading.set_result(shard)
+        self._unload(evicted)
+        return shard
+
+    def _evict(self):
+        """Drop the least recently used shards beyond max_resident; returns those nobody is using. Call with the lock held."""
+        unused = []
+        while len(self._shards) > self.max_resident:
+            evicted_case, evicted = self._shards.popitem(last=False)
+            if self._users.get(evicted_case):
+                self._retired[evicted_case] = evicted
+            else:
+                unused.append((evicted_case, evicted))
+        return unused
+
+    def _release(self, case):
+        with self._lock:
+            self._users[case] -= 1
+            if self._users[case]:
+                return
+            del self._users[case]
+            retired = self._retired.pop(case, None)
+        if retired is not None:
+            self._unload([(case, retired)])
+
+    def _unload(self, shards):
+        for case, shard in shards:
+            logger.info(f"Unloading case shard {case}")
+            shard.unload()
+
+    @contextmanager
+    def use(self, cases):
+        """The shards of the given cases, kept loaded until the block ends."""
+        acquired = []
+        try:
+            for case in cases:
+                acquired.append((case, self._acquire(case)))
+            yield [shard for _, shard in acquired]
+        finally:
+            for case, _ in acquired:
+                self._release(case)
+
+    def refresh(self, case):
+        """
+        Re-ingest a case whose files changed; only changed chunks are re-embedded. The refreshed
+        shard replaces the old one once it is complete, requests already using the old one keep it.
+        Returns whether the case changed.
+        """
+        with self.use([case]) as (shard,):
+            if not shard.is_stale():
+                return False
+            refreshed = shard.refresh()
+        with self._lock:
+            # Not unloaded: it shares its index paths, and with them the cached indexes, with the new one
+            if self._shards.get(case) is shard:
+                self._shards[case] = refreshed
+            elif self._retired.get(case) is shard:
+                self._retired[case] = refreshed
+        return True
+
+    def version(self, cases):
+        """Cache version of a set of cases; changes when any of them is re-ingested."""
+        cases = sorted(cases)
+        with self.use(cases) as shards:
+            versions = [f"{case}:{shard.version}" for case, shard in zip(cases, shards)]
+        return hashlib.sha256("\n".join(versions).encode("utf-8")).hexdigest()
+
+    def retrieve(self, question, cases, k=FUSION_TOP_K, weights=None):
+        """
+        Hybrid retrieval over the given cases only. The question is embedded once, each shard
+        fuses its own BM25 and vector results, and the per-case lists are fused into the top k.
+        """
+        cases = list(dict.fromkeys(cases))
+        if not cases:
+            raise ValueError("At least one case is required")
+        with self.use(cases) as shards:
+            embedding = get_embedding_function().embed_query(question)
+            weights = weights or get_query_weights(question)
+
+            def search(shard):
+                keyword_docs, _ = keyword_search(shard.bm25_index, question, max(FUSION_FETCH_K, k))
+                vector_docs = shard.vector_store.similarity_search_by_vector(embedding, k=max(FUSION_FETCH_K, k))
+                docs, scores = fuse_rankings([keyword_docs, vector_docs], weights=weights)
+                if FUSION_DEDUP:
+                    docs, scores = dedup_documents(docs, scores, limit=k)
+                return docs[:k]
+
+            with ThreadPoolExecutor(max_workers=min(len(shards), 4)) as executor:
+                per_case = list(executor.map(search, shards))
+        if len(per_case) == 1:
+            return per_case[0]
+        return merge_retrieved_documents(per_case, k=k)
+
+    def answer_question(self, question, cases, use_cache=True):
+        """Refine and answer a question from the given cases."""
+        cases = list(dict.fromkeys(cases))
+        refined_question = refine_question(question, use_cache=use_cache)
+        relevant_docs = self.retrieve(refined_question, cases)
+        # Case-level metadata only answers questions about a single case
+        metadata_index_path = self.shard_paths(cases[0])["metadata_index_path"] if len(cases) == 1 else None
+        with self.use(cases[:1]) as (shard,):
+            result = answer_question(
+                refined_question, shard.documents, shard.vector_store,
+                use_cache=use_cache,
+                retrieved_docs=relevant_docs,
+                corpus_version=self.version(cases),
+                metadata_index_path=metadata_index_path
+            )
+        return dict(result, question=question, refined_question=refined_question, cases=cases)
+
+    def summarize_case(self, question, case, use_cache=True):
+        """Refine the request and summarize one case."""
+        refined_question = refine_question(question, use_cache=use_cache)
+        with self.use([case]) as (shard,):
+            result = summarize_case(
+                refined_question, shard.documents, shard.vector_store,
+                use_cache=use_cache,
+                retriever=shard.get_retriever(),
+                corpus_version=self.version([case])
+            )
+        return dict(result, question=question, refined_question=refined_question, case=case)
@@ -0,0 +1,159 @@
+# chat_session.py
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from llm_interface import invoke_llm, stream_llm_section, LLM_ERROR_MESSAGE
+from prompts import conversational_qa_prompt, summarize_history_prompt
+from utils import prepare_context, format_context
+from context_packing import pack_context, count_tokens
+from retrieval import get_hybrid_retriever, load_bm25_index, chunk_id
+from fusion import keyword_search
+from tracing import span
+from config import CHAT_HISTORY_TOKEN_BUDGET, CHAT_REUSE_OVERLAP, BM25_INDEX_PATH, FUSION_TOP_K
+from logging_config import logger
+
+NO_SUMMARY = "None"
+# Questions that lean on the previous turn ("what about the second one?", "when was it filed?")
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(?:and|also|what about|how about|why|so)\b|\b(?:it|its|that|this|those|these|they|them|he|she|his|her|same)\b",
+    re.IGNORECASE
+)
+SHORT_FOLLOW_UP_WORDS = 8
+
+def format_turns(turns):
+    return "\n\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+
+class ChatSession:
+    """
+    Multi-turn Q&A over a corpus. Recent turns are kept word for word within a token budget and
+    older ones are folded into a running summary, so the prompt stays bounded however long the
+    conversation gets. Follow-ups about the material of the previous turn reuse its packed context
+    instead of retrieving again, and the prompt is laid out so that consecutive turns share a
+    byte-identical prefix the model server can serve from its prompt cache.
+    """
+
+    def __init__(self, documents, vector_store, retriever=None, bm25_index_path=BM25_INDEX_PATH,
+                 history_budget=CHAT_HISTORY_TOKEN_BUDGET, reuse_overlap=CHAT_REUSE_OVERLAP):
+        self.documents = documents
+        self.vector_store = vector_store
+        self.retriever = retriever
+        self.bm25_index_path = bm25_index_path
+        self.history_budget = history_budget
+        self.reuse_overlap = reuse_overlap
+        self.turns = []  # (question, answer) pairs not yet summarized
+        self.summary = NO_SUMMARY
+        self._chunk_ids = set()  # Chunks retrieved for the current context
+        self._structured_context = None
+        self._formatted_context = None
+        # History is summarized in the background while the user reads the answer
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._compression = None  # (future of the new summary, number of turns it folds in)
+
+    def reset(self):
+        self._compression = None
+        self.turns = []
+        self.summary = NO_SUMMARY
+        self._chunk_ids = set()
+        self._structured_context = None
+        self._formatted_context = None
+
+    def is_follow_up(self, question):
+        """
+        Whether the question is about the material already in context: enough of its keyword hits
+        are chunks retrieved for the previous turn. Short questions referring back to it ("when was
+        it filed?") need half as many, since their few keywords match more of the corpus.
+        """
+        if self._formatted_context is None:
+            return False
+        bm25_retriever = load_bm25_index(self.documents, self.bm25_index_path)
+        hits, _ = keyword_search(bm25_retriever, question, FUSION_TOP_K)
+        if not hits:
+            return False
+        overlap = sum(chunk_id(doc) in self._chunk_ids for doc in hits) / len(hits)
+        refers_back = bool(FOLLOW_UP_PATTERN.search(question)) and len(question.split()) <= SHORT_FOLLOW_UP_WORDS
+        return overlap >= (self.reuse_overlap / 2 if refers_back else self.reuse_overlap)
+
+    def _retrieve(self, question):
+        retriever = self.retriever or get_hybrid_retriever(self.documents, self.vector_store, self.bm25_index_path)
+        with span("retrieve") as attributes:
+            relevant_docs = retriever.get_relevant_documents(question)
+            attributes["chunks"] = len(relevant_docs)
+        with span("pack_context") as attributes:
+            self._structured_context = pack_context(prepare_context(relevant_docs))
+            # Kept as a string so a reused context is byte for byte what the previous prompt had
+            self._formatted_context = format_context(self._structured_context)
+            attributes["chunks"] = len(self._structured_context)
+        self._chunk_ids = {chunk_id(doc) for doc in relevant_docs}
+
+    def compress_history(self):
+        """
+        Start folding the oldest turns into the running summary once the kept turns exceed the
+        budget. Turns are folded until they fit in half the budget, so the summary, and with it the
+        prompt prefix, changes only every few turns. The latest turn is always kept word for word.
+        The summary is written in the background and applied at the start of the next turn.
+        """
+        if self._compression is not None or len(self.turns) < 2:
+            return
+        if count_tokens(format_turns(self.turns)) <= self.history_budget:
+            return
+        folded = 0
+        while folded < len(self.turns) - 1 and count_tokens(format_turns(self.turns[folded:])) > self.history_budget // 2:
+            folded += 1
+        prompt = summarize_history_prompt().format(summary=self.summary, turns=format_turns(self.turns[:folded]))
+
+        def summarize():
+            with span("summarize_history", turns=folded):
+                return invoke_llm(prompt, stage="history_summary")
+
+        self._compression = (self._executor.submit(summarize), folded)
+
+    def _apply_compression(self):
+        """Replace the folded turns with the summary started after the previous turn, waiting for it if needed."""
+        if self._compression is None:
+            return
+        future, folded = self._compression
+        self._compression = None
+        summary = future.result()
+        if summary == LLM_ERROR_MESSAGE:
+            # Keep the turns, they are folded after a later turn instead
+            logger.warning("Could not summarize chat history; keeping the turns as they are.")
+            return
+        self.summary = summary
+        self.turns = self.turns[folded:]
+
+    def ask(self, question):
+        """Answer a question in the conversation. Returns {"answer", "structured_context", "reused_context"}."""
+        for section, value in self.stream(question):
+            if section == "result":
+                return value
+
+    def stream(self, question):
+        """
+        Streaming variant of ask. Yields ("answer", token) pairs as the model generates them;
+        the last item is ("result", answer_dict), where answer_dict is what ask returns.
+        """
+        self._apply_compression()
+        with span("follow_up_check") as attributes:
+            reuse = self.is_follow_up(question)
+            attributes["reused"] = reuse
+        if reuse:
+            logger.info("Follow-up question; reusing the previous turn's context.")
+        else:
+            self._retrieve(question)
+
+        prompt = conversational_qa_prompt().format(
+            conversation_summary=self.summary,
+            context=self._formatted_context,
+            chat_history=format_turns(self.turns),
+            question=question
+        )
+        answer = yield from stream_llm_section("answer", prompt)
+
+        if LLM_ERROR_MESSAGE not in answer:
+            self.turns.append((question, answer))
+            self.compress_history()
+        yield "result", {
+            "answer": answer,
+            "structured_context": self._structured_context,
+            "reused_context": reuse
+        }
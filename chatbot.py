@@ -1,23 +1,99 @@
 # chatbot.py
 
-from llm_interface import setup_llm
+from concurrent.futures import ThreadPoolExecutor
+from llm_interface import stream_llm_section, LLM_ERROR_MESSAGE
 from prompts import qa_prompt
 from utils import prepare_context, format_context
-from retrieval import get_hybrid_retriever
+from context_packing import pack_context
+from retrieval import get_hybrid_retriever, get_corpus_version, load_bm25_index, merge_retrieved_documents
+from summarizer import refine_question
+from answer_cache import ANSWER_CACHE
+from case_metadata import answer_from_metadata
+from tracing import span, bind_trace
+from config import METADATA_ROUTING, METADATA_INDEX_PATH
 from logging_config import logger
 
-def answer_question(question, documents, vector_store):
-    logger.info("Answering user question through chatbot.")
+def refine_with_speculative_retrieval(question, documents, vector_store):
+    """
+    Refine the question while hybrid retrieval runs on the raw question in the background.
+    The speculative results are merged with a keyword search for the refined question, which
+    is cheap, instead of running the full hybrid retrieval again.
+    Returns the refined question and the retrieved documents.
+    """
     retriever = get_hybrid_retriever(documents, vector_store)
-    relevant_docs = retriever.get_relevant_documents(question)
-    structured_context = prepare_context(relevant_docs)
-    formatted_context = format_context(structured_context)
 
-    llm = setup_llm()
+    def speculate():
+        with span("speculative_retrieve"):
+            return retriever.get_relevant_documents(question)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        speculative = executor.submit(bind_trace(speculate))
+        refined_question = refine_question(question)
+        speculative_docs = speculative.result()
+
+    with span("keyword_retrieve"):
+        keyword_docs = load_bm25_index(documents).get_relevant_documents(refined_question)
+    with span("merge"):
+        relevant_docs = merge_retrieved_documents([speculative_docs, keyword_docs])
+    return refined_question, relevant_docs
+
+def answer_question(question, documents, vector_store, use_cache=True, retrieved_docs=None,
+                    corpus_version=None, metadata_index_path=METADATA_INDEX_PATH):
+    """
+    Answer the question from the documents. Pass retrieved_docs to skip retrieval, e.g. after speculative retrieval.
+    corpus_version and metadata_index_path default to the configured corpus; pass metadata_index_path=None
+    to skip metadata routing.
+    """
+    events = stream_answer_question(question, documents, vector_store, use_cache, retrieved_docs,
+                                    corpus_version, metadata_index_path)
+    for section, value in events:
+        if section == "result":
+            return value
+
+def stream_answer_question(question, documents, vector_store, use_cache=True, retrieved_docs=None,
+                           corpus_version=None, metadata_index_path=METADATA_INDEX_PATH):
+    """
+    Streaming variant of answer_question. Yields ("answer", token) pairs as the model generates
+    them; the last item is ("result", answer_dict), where answer_dict is what answer_question returns.
+    """
+    logger.info("Answering user question through chatbot.")
+    corpus_version = corpus_version or get_corpus_version()
+    if use_cache:
+        cached = ANSWER_CACHE.get("qa", question, corpus_version)
+        if cached is not None:
+            logger.info("Answer served from cache.")
+            yield "answer", cached["answer"]
+            yield "result", cached
+            return
+
+    # Simple factual questions are answered from the metadata index built at ingest time
+    with span("metadata_route"):
+        routed = answer_from_metadata(question, metadata_index_path) if METADATA_ROUTING else None
+    if routed is not None:
+        logger.info("Answer served from the case metadata index.")
+        yield "answer", routed["answer"]
+        yield "result", routed
+        return
+
+    if retrieved_docs is None:
+        retriever = get_hybrid_retriever(documents, vector_store)
+        with span("retrieve") as attributes:
+            relevant_docs = retriever.get_relevant_documents(question)
+            attributes["chunks"] = len(relevant_docs)
+    else:
+        relevant_docs = retrieved_docs
+    with span("pack_context") as attributes:
+        structured_context = pack_context(prepare_context(relevant_docs))
+        formatted_context = format_context(structured_context)
+        attributes["chunks"] = len(structured_context)
+
     prompt = qa_prompt().format(user_question=question, context=formatted_context)
-    answer = llm.invoke(prompt)
+    answer = yield from stream_llm_section("answer", prompt)
 
-    return {
-        "answer": answer.content,
+    result = {
+        "answer": answer,
         "structured_context": structured_context
     }
+    if use_cache and LLM_ERROR_MESSAGE not in answer:
+        ANSWER_CACHE.put("qa", question, corpus_version, result)
+    yield "result", result
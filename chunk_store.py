@@ -0,0 +1,164 @@
+# chunk_store.py
+
+import os
+import json
+import mmap
+import time
+import shutil
+from collections.abc import Sequence
+import numpy as np
+from logging_config import logger
+
+TEXT_FILE = "text.bin"
+OFFSETS_FILE = "offsets.npy"
+SOURCE_IDS_FILE = "source_ids.npy"
+PAGES_FILE = "pages.npy"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"  # Name of the current version
+NO_PAGE = -1
+
+def _remove_old_versions(directory, current):
+    """Delete the versions (and unversioned files) other than current. Ones still mapped, on Windows, are left for a later build."""
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in (current, CURRENT_FILE):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in (TEXT_FILE, OFFSETS_FILE, SOURCE_IDS_FILE, PAGES_FILE, META_FILE):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def _page_number(value):
+    return int(value) if str(value).lstrip("-").isdigit() else NO_PAGE
+
+class ChunkStore(Sequence):
+    """
+    Compact, read-only store of a corpus' chunks. All chunk text is one memory-mapped UTF-8
+    file addressed by an offsets array, sources are interned and pages kept as an array, so a
+    loaded case costs little more than its arrays. Indexing returns a langchain Document built
+    on demand, so only the chunks actually used (e.g. the top-k hits) are materialized.
+    It is a Sequence and can be passed wherever a list of documents is expected.
+    Each build is written to a new version directory; directory is the version that was opened.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.fingerprint = meta.get("fingerprint")
+        self._sources = meta["sources"]
+        # Metadata other than source and page is rare, so it is kept per chunk only where present
+        self._extras = {int(index): extra for index, extra in meta.get("extras", {}).items()}
+        self._offsets = np.load(self._path(OFFSETS_FILE), mmap_mode="r")
+        self._source_ids = np.load(self._path(SOURCE_IDS_FILE))
+        self._pages = np.load(self._path(PAGES_FILE))
+        self._text = None
+        # Empty files can't be memory-mapped
+        if os.path.getsize(self._path(TEXT_FILE)):
+            with open(self._path(TEXT_FILE), "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @classmethod
+    def open(cls, directory):
+        """Open the current version of a saved store, or return None if there is none."""
+        current_path = os.path.join(directory, CURRENT_FILE)
+        if os.path.exists(current_path):
+            with open(current_path, "r", encoding="utf-8") as f:
+                store_directory = os.path.join(directory, f.read().strip())
+        else:
+            # Stores written before they were versioned keep their files in the directory itself
+            store_directory = directory
+        if not os.path.exists(os.path.join(store_directory, META_FILE)):
+            return None
+        return cls(store_directory)
+
+    @classmethod
+    def build(cls, documents, directory, fingerprint=None):
+        """
+        Write the documents' text and metadata to a new version under directory, make it the
+        current one and open it. Files of a store that is still open (and memory-mapped) are never
+        replaced, which Windows doesn't allow; older versions are removed once nothing maps them.
+        """
+        version = f"v{time.time_ns()}"
+        store_directory = os.path.join(directory, version)
+        os.makedirs(store_directory)
+        offsets = [0]
+        source_codes = {}
+        source_ids = []
+        pages = []
+        extras = {}
+        with open(os.path.join(store_directory, TEXT_FILE), "wb") as f:
+            for index, doc in enumerate(documents):
+                data = doc.page_content.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+                source = str(doc.metadata.get("source", "Unknown"))
+                source_ids.append(source_codes.setdefault(source, len(source_codes)))
+                pages.append(_page_number(doc.metadata.get("page", NO_PAGE)))
+                extra = {key: value for key, value in doc.metadata.items() if key not in ("source", "page")}
+                if extra:
+                    extras[str(index)] = extra
+
+        np.save(os.path.join(store_directory, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+        np.save(os.path.join(store_directory, SOURCE_IDS_FILE), np.asarray(source_ids, dtype=np.int32))
+        np.save(os.path.join(store_directory, PAGES_FILE), np.asarray(pages, dtype=np.int32))
+        meta = {
+            "count": len(source_ids),
+            "sources": [source for source, _ in sorted(source_codes.items(), key=lambda item: item[1])],
+            "extras": extras,
+            "fingerprint": [list(item) for item in fingerprint] if fingerprint is not None else None
+        }
+        with open(os.path.join(store_directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        # Switching the pointer is what makes the new version current
+        tmp_current = os.path.join(directory, f"{CURRENT_FILE}.tmp")
+        with open(tmp_current, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_current, os.path.join(directory, CURRENT_FILE))
+        _remove_old_versions(directory, version)
+        logger.info(f"Saved {len(source_ids)} chunks ({offsets[-1]} bytes of text) to {store_directory}")
+        return cls(store_directory)
+
+    def matches(self, fingerprint):
+        return self.fingerprint == [list(item) for item in fingerprint]
+
+    def __len__(self):
+        return len(self._pages)
+
+    def text(self, index):
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._text[start:end].decode("utf-8") if end > start else ""
+
+    def metadata(self, index):
+        metadata = {"source": self._sources[self._source_ids[index]]}
+        page = int(self._pages[index])
+        if page != NO_PAGE:
+            metadata["page"] = page
+        metadata.update(self._extras.get(index, {}))
+        return metadata
+
+    def __getitem__(self, index):
+        from langchain_core.documents import Document
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        return Document(page_content=self.text(index), metadata=self.metadata(index))
+
+    def __reduce__(self):
+        # Pickled (e.g. inside the BM25 index) as its location, not its contents
+        return ChunkStore, (self.directory,)
+
+    @property
+    def sources(self):
+        return list(self._sources)
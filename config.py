@@ -4,9 +4,89 @@ import os
 
 # Global Variables
 MODEL_NAME = 'mistral'  # Replace with your actual model
+OLLAMA_KEEP_ALIVE = '30m'  # How long Ollama keeps the model loaded between calls
 EMBEDDING_MODEL_NAME = "Alibaba-NLP/gte-large-en-v1.5"  # HuggingFace embedding model
+DOCUMENT_PATH = 'docs/law-data/case2'  # Case folder (PDFs) or markdown file to analyse
 PERSIST_DIRECTORY = 'storage-db/law2'
 COLLECTION_NAME = 'law'
+VECTOR_BACKEND = 'chroma'  # 'chroma', or 'numpy' for the in-process memory-mapped store (single cases, small corpora)
+NUMPY_STORE_DIRECTORY = f"{PERSIST_DIRECTORY}_numpy"
+VECTOR_QUANTIZATION = None  # NumPy store only: 'float16' or 'int8' first pass, rescored exactly
+BM25_INDEX_PATH = f"{PERSIST_DIRECTORY}_bm25.pkl"  # Prebuilt keyword index, saved next to the vector store
+METADATA_INDEX_PATH = f"{PERSIST_DIRECTORY}_metadata.json"  # Case names, numbers, courts, dates and parties per chunk
+CHUNK_STORE_DIRECTORY = f"{PERSIST_DIRECTORY}_chunks"  # Memory-mapped chunk text and metadata, reused while the files are unchanged
+# Files and chunk content hashes already in the vector store, one manifest per backend
+MANIFEST_PATH = f"{PERSIST_DIRECTORY if VECTOR_BACKEND == 'chroma' else NUMPY_STORE_DIRECTORY}_manifest.json"
+EMBEDDING_CACHE_DIR = 'storage-db/embedding-cache'  # Shared by all stores; set to None to disable
+EMBEDDING_BATCH_SIZE = 32  # Chunks per forward pass; chunks of similar length are batched together
+EMBEDDING_WORKERS = 1  # Processes used to embed chunks during ingestion
+EMBEDDING_QUANTIZE = None  # Set to 'int8' to use a dynamically quantized model on CPU
+
+# Hybrid retrieval
+FUSION_STRATEGY = 'rrf'  # 'rrf' (reciprocal rank) or 'weighted' (min-max normalized scores)
+FUSION_RRF_C = 60
+FUSION_TOP_K = 10  # Chunks returned per question after fusion
+FUSION_FETCH_K = 20  # Candidates taken from each of the keyword and vector retrievers
+FUSION_DEDUP = True  # Drop chunks that overlap a better-ranked chunk of the same page
+FUSION_MMR_LAMBDA = None  # e.g. 0.7 to trade some relevance for diversity; None disables MMR
+# (keyword, vector) weights by question type, see fusion.classify_query
+FUSION_QUERY_WEIGHTS = {
+    'date': (0.8, 0.2),
+    'citation': (0.8, 0.2),
+    'conceptual': (0.4, 0.6),
+    'default': (0.6, 0.4)
+}
+
+# Multi-case archive
+CASES_DIRECTORY = 'docs/law-data'  # One subfolder (or markdown file) per case
+SHARDS_DIRECTORY = 'storage-db/cases'  # Each case gets its own vector store and indexes here
+MAX_RESIDENT_SHARDS = 4  # Cases kept loaded; the least recently used one is unloaded beyond this
+
+# Ingestion
+INGEST_WORKERS = 1  # Processes used to parse and split PDFs; 1 keeps everything in-process
+OCR_ENABLED = True  # OCR pages whose text layer is empty or unreadable (needs tesseract and poppler)
+OCR_WORKERS = 4  # Processes OCRing pages at the same time
+OCR_DPI = 300  # Resolution pages are rendered at for OCR
+OCR_LANGUAGE = 'eng'  # tesseract language(s), e.g. 'eng+fra'
+OCR_MIN_CHARS = 50  # Pages with less text than this are treated as scans
+OCR_MIN_READABLE_RATIO = 0.6  # Pages with fewer tokens that read as words or numbers get OCRed
+OCR_CACHE_DIR = 'storage-db/ocr-cache'  # OCR text, keyed by a hash of the page
+
+# Q&A pipeline
+SPECULATIVE_RETRIEVAL = True  # Retrieve on the raw question while the LLM refines it
+METADATA_ROUTING = True  # Answer case number/date/court/party questions from the metadata index, without the LLM
+STREAM_OUTPUT = True  # Print answers and summaries token by token as they are generated
+CONTEXT_TOKENIZER = 'cl100k_base'  # tiktoken encoding used to count context tokens
+CONTEXT_TOKEN_BUDGETS = {'mistral': 3000}  # Context tokens per prompt, by model
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2000
+LLM_CONCURRENCY = 2  # Requests sent to the LLM backend at the same time
+
+# Conversational Q&A
+CHAT_HISTORY_TOKEN_BUDGET = 1000  # Recent turns kept word for word; older turns are folded into a running summary
+CHAT_REUSE_OVERLAP = 0.5  # Share of a question's keyword hits already in the last context for that context to be reused; halved for short questions referring back
+
+# Map-reduce summarization
+SUMMARY_CACHE_DIR = 'storage-db/summary-cache'  # Intermediate summaries, keyed by content hash
+MAP_REDUCE_FAN_IN = 4  # Summaries combined per reduce step
+
+# HTTP service
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8080
+
+# Answer cache
+ANSWER_CACHE_SIZE = 256  # Entries kept before the least recently used one is evicted
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANSWER_CACHE_SIMILARITY = 0.95  # Reuse the answer to a reworded question at this cosine similarity (same question type only); None disables it
+
+# Tracing and metrics
+TRACING_ENABLED = True  # Time every pipeline stage and count LLM tokens
+TRACE_DIRECTORY = 'storage-db/traces'  # One JSON trace per request; None disables the dumps
+METRICS_WINDOW = 10000  # Latest samples per stage used for the p50/p95 figures
+METRICS_EXPORT_PATH = 'storage-db/metrics.json'  # Written by tracing.export_metrics
+METRICS_EXPORT_URL = None  # Local collector the metrics snapshot is POSTed to, e.g. 'http://127.0.0.1:9091/metrics'
+
+# Startup
+IMPORT_TIME_BUDGET_SECONDS = 2.0  # Checked by benchmarks/import_time.py
 
 # OpenAI API Key (if using OpenAI models)
 # os.environ["OPENAI_API_KEY"] = "your_openai_api_key"
@@ -0,0 +1,95 @@
+# context_packing.py
+
+from functools import lru_cache
+from config import MODEL_NAME, CONTEXT_TOKENIZER, CONTEXT_TOKEN_BUDGETS, DEFAULT_CONTEXT_TOKEN_BUDGET
+from logging_config import logger
+
+MIN_OVERLAP_CHARS = 50  # Shorter shared prefixes/suffixes are left alone
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Jaccard similarity of word shingles above which a chunk is dropped
+SHINGLE_SIZE = 5
+
+@lru_cache(maxsize=None)
+def get_tokenizer(encoding_name=CONTEXT_TOKENIZER):
+    import tiktoken
+    return tiktoken.get_encoding(encoding_name)
+
+def count_tokens(text, encoding_name=CONTEXT_TOKENIZER):
+    return len(get_tokenizer(encoding_name).encode(text, disallowed_special=()))
+
+def get_context_budget(model_name=MODEL_NAME):
+    return CONTEXT_TOKEN_BUDGETS.get(model_name, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+def find_overlap(previous, current, min_overlap=MIN_OVERLAP_CHARS):
+    """Length of the longest suffix of previous that is also a prefix of current."""
+    if len(previous) < min_overlap or len(current) < min_overlap:
+        return 0
+    anchor = current[:min_overlap]
+    start = previous.find(anchor)
+    while start != -1:
+        tail = previous[start:]
+        if current.startswith(tail):
+            return len(tail)
+        start = previous.find(anchor, start + 1)
+    return 0
+
+def shingles(text):
+    """Word n-grams of the text, used to spot near-duplicate chunks."""
+    words = text.lower().split()
+    if len(words) <= SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def jaccard(a, b):
+    """Jaccard similarity of two shingle sets."""
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _format_item(item):
+    # Must match utils.format_context so the token counts are exact
+    return f"File: {item['file_name']}, Page: {item['page_number']}\n{item['content']}\n"
+
+def pack_context(structured_context, budget=None, model_name=MODEL_NAME):
+    """
+    Pack whole chunks into the model's context token budget, best retrieval score first.
+    Text repeated from the overlap with an already packed chunk of the same file is trimmed,
+    and chunks that are near-duplicates of a packed chunk are dropped. Chunks that don't fit
+    are skipped, never cut. Items are ranked by their 'score' if present, else by their order.
+    """
+    budget = budget or get_context_budget(model_name)
+    if any("score" in item for item in structured_context):
+        ranked = sorted(structured_context, key=lambda item: item.get("score", 0.0), reverse=True)
+    else:
+        ranked = list(structured_context)
+
+    packed = []
+    packed_shingles = []
+    used_tokens = 0
+    for item in ranked:
+        content = item["content"].strip()
+        for other in packed:
+            if other["file_name"] != item["file_name"]:
+                continue
+            # This chunk follows a packed one: drop the repeated start
+            overlap = find_overlap(other["content"], content)
+            if overlap:
+                content = content[overlap:].lstrip()
+            # This chunk precedes a packed one: drop the repeated end
+            overlap = find_overlap(content, other["content"])
+            if overlap:
+                content = content[:len(content) - overlap].rstrip()
+        if not content:
+            continue
+
+        content_shingles = shingles(content)
+        if any(jaccard(content_shingles, other) >= NEAR_DUPLICATE_THRESHOLD for other in packed_shingles):
+            continue
+
+        candidate = dict(item, content=content)
+        tokens = count_tokens(_format_item(candidate))
+        if used_tokens + tokens > budget:
+            continue
+        packed.append(candidate)
+        packed_shingles.append(content_shingles)
+        used_tokens += tokens
+
+    logger.info(f"Packed {len(packed)} of {len(structured_context)} chunks into {used_tokens}/{budget} context tokens.")
+    return packed
@@ -0,0 +1,154 @@
+# corpus.py
+
+import os
+import threading
+from retrieval import (
+    load_or_create_vector_store,
+    load_bm25_index,
+    unload_bm25_index,
+    close_vector_store,
+    get_hybrid_retriever,
+    get_store_paths,
+    get_corpus_version
+)
+from case_metadata import unload_metadata_index
+from chunk_store import ChunkStore
+from ocr import ocr_available
+from config import OCR_ENABLED, OCR_DPI, OCR_LANGUAGE, OCR_MIN_CHARS, OCR_MIN_READABLE_RATIO
+from logging_config import logger
+
+def compute_fingerprint(document_path):
+    """
+    Cheap change detector for a document folder or file: path, size and mtime of every input file.
+    A folder's input files are the PDFs load_corpus_documents reads, so other files don't count.
+    """
+    # Imported here because document_processing itself uses the corpus registry
+    from document_processing import list_pdf_files
+
+    paths = [document_path] if os.path.isfile(document_path) else list_pdf_files(document_path)
+    fingerprint = []
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+def load_corpus_documents(document_path, ocr_failures=None):
+    """
+    Parse and split a markdown file or a folder of PDFs into chunks. Pages OCR failed on are
+    collected in ocr_failures if it is given.
+    """
+    # Imported here because document_processing itself uses the corpus registry
+    from document_processing import load_documents_from_directory, load_documents_from_markdown
+
+    if document_path.endswith('.md'):
+        return load_documents_from_markdown(document_path)
+    return load_documents_from_directory(document_path, ocr_failures=ocr_failures)
+
+def load_chunk_store(document_path, directory, fingerprint):
+    """
+    Open the saved chunks of a document path, parsing and splitting the files again only if
+    they or the OCR settings changed since the store was written, or OCR failed on some page
+    then (so it is retried).
+    """
+    # The chunks depend on the OCR settings as well as the files; without the OCR binaries it is off
+    ocr_enabled = OCR_ENABLED and ocr_available()
+    fingerprint = tuple(fingerprint) + (("ocr", ocr_enabled, OCR_DPI, OCR_LANGUAGE, OCR_MIN_CHARS, OCR_MIN_READABLE_RATIO),)
+    store = ChunkStore.open(directory)
+    if store is not None and store.matches(fingerprint):
+        logger.info(f"Documents in {document_path} unchanged, using the chunk store in {directory}")
+        return store
+    ocr_failures = []
+    documents = load_corpus_documents(document_path, ocr_failures)
+    if ocr_failures:
+        logger.warning(f"OCR failed for {len(ocr_failures)} page(s) in {document_path}; the chunk store will be rebuilt on the next load to retry them.")
+        # A store without a fingerprint never matches
+        fingerprint = None
+    return ChunkStore.build(documents, directory, fingerprint)
+
+class Corpus:
+    """
+    The parsed chunks, keyword index and vector store of one document folder.
+    Built once per session and reused for every question; refresh() returns an updated copy, and
+    get_corpus(..., check_for_changes=True) swaps it in, to pick up changed files.
+    documents is a memory-mapped ChunkStore, so chunks are only materialized when used.
+    paths (see retrieval.get_store_paths) says where its indexes live; the default is config.py's.
+    """
+
+    def __init__(self, document_path, documents, vector_store, fingerprint, paths=None):
+        self.document_path = document_path
+        self.documents = documents
+        self.vector_store = vector_store
+        self.fingerprint = fingerprint
+        self.paths = paths or get_store_paths()
+        self._retriever = None
+
+    @classmethod
+    def load(cls, document_path, vector_store=None, paths=None):
+        logger.info(f"Loading corpus from {document_path}")
+        paths = paths or get_store_paths()
+        fingerprint = compute_fingerprint(document_path)
+        documents = load_chunk_store(document_path, paths["chunk_store_directory"], fingerprint)
+        if vector_store is None:
+            vector_store = load_or_create_vector_store(documents, paths)
+        return cls(document_path, documents, vector_store, fingerprint, paths)
+
+    @property
+    def bm25_index(self):
+        return load_bm25_index(self.documents, index_path=self.paths["bm25_index_path"])
+
+    @property
+    def version(self):
+        return get_corpus_version(self.paths["manifest_path"])
+
+    def get_retriever(self):
+        if self._retriever is None:
+            self._retriever = get_hybrid_retriever(self.documents, self.vector_store, bm25_index_path=self.paths["bm25_index_path"])
+        return self._retriever
+
+    def is_stale(self):
+        return compute_fingerprint(self.document_path) != self.fingerprint
+
+    def refresh(self):
+        """
+        Return a new Corpus with the documents reloaded and the indexes brought up to date; only
+        changed chunks are re-embedded. This one is left as it is, so requests holding it keep a
+        consistent set of chunks, store and retriever until the caller switches to the new one.
+        """
+        logger.info(f"Documents in {self.document_path} changed, refreshing corpus")
+        refreshed = Corpus.load(self.document_path, paths=self.paths)
+        refreshed.get_retriever()
+        return refreshed
+
+    def unload(self):
+        """
+        Release the in-memory keyword and metadata indexes and close the vector store. The corpus
+        can't be queried afterwards; load it again instead.
+        """
+        unload_bm25_index(self.paths["bm25_index_path"])
+        unload_metadata_index(self.paths["metadata_index_path"])
+        close_vector_store(self.vector_store)
+        self.vector_store = None
+        self._retriever = None
+
+# Loaded corpora, keyed by document path
+_CORPORA = {}
+_CORPORA_LOCK = threading.Lock()
+
+def get_corpus(document_path, vector_store=None, check_for_changes=False):
+    """Return the session's corpus for the document path, loading it on first use."""
+    with _CORPORA_LOCK:
+        corpus = _CORPORA.get(document_path)
+        if corpus is None:
+            corpus = Corpus.load(document_path, vector_store=vector_store)
+            _CORPORA[document_path] = corpus
+        elif check_for_changes and corpus.is_stale():
+            corpus = _CORPORA[document_path] = corpus.refresh()
+    return corpus
+
+def invalidate_corpus(document_path=None):
+    """Drop a loaded corpus (or all of them) so the next get_corpus call loads it again."""
+    with _CORPORA_LOCK:
+        if document_path is None:
+            _CORPORA.clear()
+        else:
+            _CORPORA.pop(document_path, None)
@@ -1,12 +1,19 @@
 import logging
-from langchain_community.document_loaders import PyPDFDirectoryLoader, UnstructuredMarkdownLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from retrieval import load_or_create_vector_store  # Assuming your vector store loader
-from utils import format_context, truncate_context  # For context formatting
+from utils import prepare_context, format_context as format_structured_context  # For context formatting
+from context_packing import pack_context  # Fits whole chunks into the model's token budget
 from prompts import qa_prompt  # The question-answering prompt
 from llm_interface import invoke_llm  # LLM invocation
 from retrieval import get_hybrid_retriever
+from corpus import get_corpus  # Loaded chunks and indexes, shared across questions
+from case_metadata import YEAR_PATTERN
+from tracing import span
+from ocr import ocr_scanned_pages
+from config import INGEST_WORKERS, OCR_ENABLED
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from pathlib import Path
 import re
 
 
@@ -14,8 +21,13 @@ import re
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The langchain loaders and splitters are imported inside the functions that use them,
+# so importing this module stays cheap
+
 def split_documents(documents):
     """Split documents into smaller chunks for better retrieval and context management."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=512,  # Reduce chunk size to increase granularity
         chunk_overlap=150  # Slight overlap to ensure context is preserved
@@ -29,8 +41,7 @@ def split_documents(documents):
 
 def extract_year_from_context(context):
     """Extract year from context using regex."""
-    year_pattern = r"\b(?:19|20)\d{2}\b"  # Matches four-digit years starting with 19xx or 20xx
-    years = re.findall(year_pattern, context)
+    years = YEAR_PATTERN.findall(context)  # Precompiled, matches four-digit years starting with 19xx or 20xx
     if years:
         return sorted(years)[0]  # Return the earliest year found
     return "Year not found in context"
@@ -60,24 +71,22 @@ def format_context(chunks):
 def retrieve_and_answer_question(question, document_path, vector_store):
     """Retrieve relevant document chunks and pass them to the LLM for answering the question."""
     
-    # Load and split documents into chunks
-    documents = load_and_segment_documents(document_path)
+    # The parsed chunks and indexes are loaded once per session and reused for every question
+    corpus = get_corpus(document_path, vector_store=vector_store, check_for_changes=True)
     
     # Retrieve relevant chunks based on the question
-    retriever = get_hybrid_retriever(documents, vector_store)
-    relevant_docs = retriever.get_relevant_documents(question)
+    with span("retrieve"):
+        relevant_docs = corpus.get_retriever().get_relevant_documents(question)
     
-    # Format the relevant chunks into a single context
-    formatted_context = format_context(relevant_docs)
-    
-    # Truncate context if it's too large for the model
-    formatted_context = truncate_context(formatted_context, max_tokens=2000)
+    # Pack the most relevant whole chunks into the token budget and format them as a single context
+    with span("pack_context"):
+        formatted_context = format_structured_context(pack_context(prepare_context(relevant_docs)))
 
     # Prepare the prompt for the LLM
     prompt = qa_prompt().format(user_question=question, context=formatted_context)
     
     # Get the answer from the LLM
-    answer = invoke_llm(prompt)
+    answer = invoke_llm(prompt, stage="answer")
     
     # If the LLM didn't provide the year, fall back to regex extraction
     if "year" in question.lower() and "Year not found" not in answer:
@@ -95,37 +104,123 @@ def preprocess_document(document):
     cleaned_content = document.page_content.replace('\n', ' ').strip() if hasattr(document, 'page_content') else document['content']
     return cleaned_content
 
-def load_documents_from_directory(document_path: str):
+def list_pdf_files(document_path: str):
     """
-    Load and preprocess documents from a directory containing PDFs. Adjust chunk size based on the number of documents.
+    List the PDFs in a directory and its subfolders in a stable order. Like PyPDFDirectoryLoader,
+    files in hidden folders and hidden files are skipped.
     """
-    logger.info(f"Loading documents from {document_path}...")
-    
-    # Use the PyPDFDirectoryLoader to load documents
-    documents = PyPDFDirectoryLoader(document_path).load_and_split()
-    
-    # Adjust chunk size and overlap dynamically based on document length
-    chunk_size = 1024 if len(documents) > 100 else 512  # Example of adjusting chunk size
-    chunk_overlap = 200 if chunk_size == 1024 else 100
+    root = Path(document_path)
+    return sorted(
+        str(path) for path in root.glob("**/[!.]*.pdf")
+        if path.is_file() and not any(part.startswith(".") for part in path.relative_to(root).parts)
+    )
 
-    # Initialize the text splitter
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    split_docs = text_splitter.split_documents(documents)
+def parse_pdf_pages(file_path: str):
+    """Parse a single PDF into one document per page, empty pages included. Runs inside the worker processes in parallel mode."""
+    from langchain_community.document_loaders import PyPDFLoader
 
-    # Log and preprocess documents
-    processed_docs = []
-    for idx, doc in enumerate(split_docs):
-        cleaned_content = preprocess_document(doc)
-        # logger.info(f"Document {idx} preview: {cleaned_content[:500]}")  # Debugging: Print first 500 characters
-        doc.page_content = cleaned_content
-        processed_docs.append(doc)
-    
+    return PyPDFLoader(file_path).load()
+
+def split_pages(pages):
+    """Split long pages the way PyPDFLoader.load_and_split does; empty pages are dropped."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter().split_documents(pages)
+
+def load_pdf_pages(file_path: str, ocr: bool = OCR_ENABLED):
+    """Parse a single PDF into page documents, OCRing the pages without a usable text layer."""
+    pages = parse_pdf_pages(file_path)
+    if ocr:
+        pages = ocr_scanned_pages(pages)
+    return split_pages(pages)
+
+@lru_cache(maxsize=None)
+def get_tiktoken_splitter(chunk_size, chunk_overlap):
+    """One splitter per setting and process, so the tiktoken encoder is only loaded once."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def split_and_preprocess(documents, chunk_size, chunk_overlap):
+    """Split page documents into token-sized chunks and clean up their content."""
+    split_docs = get_tiktoken_splitter(chunk_size, chunk_overlap).split_documents(documents)
+    for doc in split_docs:
+        doc.page_content = preprocess_document(doc)
+    return split_docs
+
+def ocr_and_split(pages_per_file, ocr, ocr_failures=None):
+    """
+    OCR the scanned pages of all files in one go, so they share one process pool, then split each
+    file's pages. The pages OCR failed on are added to ocr_failures as (source, page) if it is given.
+    """
+    if ocr:
+        pages = ocr_scanned_pages([page for pages in pages_per_file for page in pages])
+        if ocr_failures is not None:
+            ocr_failures.extend(
+                (page.metadata["source"], page.metadata["page"]) for page in pages if page.metadata.get("ocr_failed")
+            )
+    return [split_pages(pages) for pages in pages_per_file]
+
+def iter_documents_from_directory(document_path: str, num_workers: int = INGEST_WORKERS, ocr: bool = OCR_ENABLED,
+                                  ocr_failures=None):
+    """
+    Yield the processed chunks of every PDF in the directory, file by file.
+    With num_workers > 1 files are parsed and split across a process pool, but chunks are
+    still yielded in file order so the output is identical to the serial path.
+    With ocr, pages without a usable text layer are OCRed (see ocr.ocr_scanned_pages); pages it
+    failed on are collected in ocr_failures (see ocr_and_split).
+    """
+    files = list_pdf_files(document_path)
+    num_workers = max(1, min(num_workers or 1, len(files)))
+    logger.info(f"Loading {len(files)} PDFs from {document_path} with {num_workers} worker(s)...")
+
+    if num_workers == 1:
+        with span("parse_pdfs", files=len(files)):
+            pages_per_file = [parse_pdf_pages(file_path) for file_path in files]
+        pages_per_file = ocr_and_split(pages_per_file, ocr, ocr_failures)
+        chunk_size, chunk_overlap = get_chunk_settings(sum(len(pages) for pages in pages_per_file))
+        for pages in pages_per_file:
+            yield from split_and_preprocess(pages, chunk_size, chunk_overlap)
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        # The chunk size depends on the size of the whole folder, so parsing has to finish first
+        with span("parse_pdfs", files=len(files)):
+            pages_per_file = list(executor.map(parse_pdf_pages, files))
+        pages_per_file = ocr_and_split(pages_per_file, ocr, ocr_failures)
+        chunk_size, chunk_overlap = get_chunk_settings(sum(len(pages) for pages in pages_per_file))
+        split_results = executor.map(split_and_preprocess, pages_per_file, repeat(chunk_size), repeat(chunk_overlap))
+        for split_docs in split_results:
+            yield from split_docs
+
+def get_chunk_settings(num_documents):
+    """Adjust chunk size and overlap dynamically based on document length."""
+    chunk_size = 1024 if num_documents > 100 else 512  # Example of adjusting chunk size
+    chunk_overlap = 200 if chunk_size == 1024 else 100
+    return chunk_size, chunk_overlap
+
+def load_documents_from_directory(document_path: str, num_workers: int = INGEST_WORKERS, ocr: bool = OCR_ENABLED,
+                                  ocr_failures=None):
+    """
+    Load and preprocess documents from a directory containing PDFs. Adjust chunk size based on the number of documents.
+    Set num_workers above 1 to parse and split the files in parallel. Pages OCR failed on are
+    collected in ocr_failures if it is given.
+    """
+    logger.info(f"Loading documents from {document_path}...")
+    with span("load_documents") as attributes:
+        processed_docs = list(iter_documents_from_directory(
+            document_path, num_workers=num_workers, ocr=ocr, ocr_failures=ocr_failures
+        ))
+        attributes["chunks"] = len(processed_docs)
+    logger.info(f"Loaded {len(processed_docs)} chunks from {document_path}")
     return processed_docs
 
 def load_documents_from_markdown(document_path: str):
     """
     Load and preprocess markdown documents from a file.
     """
+    from langchain_community.document_loaders import UnstructuredMarkdownLoader
+
     logger.info(f"Loading markdown document from {document_path}...")
     
     # Use the UnstructuredMarkdownLoader to load the markdown file
@@ -133,7 +228,7 @@ def load_documents_from_markdown(document_path: str):
     documents = loader.load()
     
     # Initialize text splitter with default chunk size and overlap
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=1024, chunk_overlap=200)
+    text_splitter = get_tiktoken_splitter(1024, 200)
     split_docs = text_splitter.split_documents(documents)
 
     # Log and preprocess documents
@@ -146,26 +241,13 @@ def load_documents_from_markdown(document_path: str):
     
     return processed_docs
 
-def load_documents_with_ocr(document_path: str):
+def load_documents_with_ocr(document_path: str, num_workers: int = INGEST_WORKERS):
     """
-    Load documents from a directory using OCR if PDFs contain scanned images or complex formatting.
+    Load documents from a directory of PDFs, or a single PDF, OCRing the pages that are scanned
+    images or have an unreadable text layer, whatever OCR_ENABLED is set to.
     """
-
     logger.info(f"Loading documents from {document_path} with OCR...")
-    loader = PyPDFLoader(document_path)
-    documents = loader.load_and_split()
-    
-    # Initialize text splitter with default chunk size and overlap
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=1024, chunk_overlap=200)
-    split_docs = text_splitter.split_documents(documents)
-
-    # Log and preprocess documents
-    processed_docs = []
-    for idx, doc in enumerate(split_docs):
-        cleaned_content = preprocess_document(doc)
-        logger.info(f"Document {idx} preview: {cleaned_content[:500]}")  # Debugging: Print first 500 characters
-        doc.page_content = cleaned_content
-        processed_docs.append(doc)
-    
-    return processed_docs
-
+    if document_path.lower().endswith(".pdf"):
+        pages = load_pdf_pages(document_path, ocr=True)
+        return split_and_preprocess(pages, *get_chunk_settings(len(pages)))
+    return load_documents_from_directory(document_path, num_workers=num_workers, ocr=True)
@@ -0,0 +1,53 @@
+# embedding_cache.py
+
+import re
+import hashlib
+from array import array
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME, EMBEDDING_QUANTIZE
+from logging_config import logger
+
+def normalize_text(text):
+    """Collapse whitespace so formatting-only differences map to the same cache entry."""
+    return " ".join(text.split())
+
+def embedding_model_id(model_name=EMBEDDING_MODEL_NAME, quantize=EMBEDDING_QUANTIZE):
+    """Identifies the vectors a model produces; a quantized model gives different vectors than the full one."""
+    return f"{model_name}-{quantize or 'fp32'}"
+
+def embedding_cache_key(text, model_name=EMBEDDING_MODEL_NAME, quantize=EMBEDDING_QUANTIZE):
+    """Cache key made of the embedding model, its quantization and the hash of the normalized chunk text."""
+    namespace = re.sub(r"[^a-zA-Z0-9_.\-]", "_", embedding_model_id(model_name, quantize))
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    # Spread the files over subdirectories so no single directory gets too large
+    return f"{namespace}/{digest[:2]}/{digest}"
+
+def serialize_embedding(vector):
+    return array("f", vector).tobytes()
+
+def deserialize_embedding(data):
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+def get_cached_embeddings(underlying, cache_dir=EMBEDDING_CACHE_DIR, model_name=EMBEDDING_MODEL_NAME,
+                          quantize=EMBEDDING_QUANTIZE, batch_size=256):
+    """
+    Wrap an embedding function with a persistent, content-addressed cache.
+    embed_documents only sends cache misses to the model, in batches of batch_size;
+    queries are passed straight through.
+    """
+    if not cache_dir:
+        return underlying
+
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+    from langchain.storage.encoder_backed import EncoderBackedStore
+
+    logger.info(f"Using embedding cache in {cache_dir}")
+    store = EncoderBackedStore(
+        LocalFileStore(cache_dir),
+        key_encoder=lambda text: embedding_cache_key(text, model_name, quantize),
+        value_serializer=serialize_embedding,
+        value_deserializer=deserialize_embedding
+    )
+    return CacheBackedEmbeddings(underlying, store, batch_size=batch_size)
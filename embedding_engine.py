@@ -0,0 +1,127 @@
+# embedding_engine.py
+
+import os
+import time
+import threading
+import multiprocessing
+from langchain_core.embeddings import Embeddings
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, EMBEDDING_QUANTIZE
+from logging_config import logger
+
+QUANTIZE_OPTIONS = (None, 'int8')
+
+def load_embedding_model(model_name=EMBEDDING_MODEL_NAME, quantize=EMBEDDING_QUANTIZE):
+    """Load the sentence-transformers model, optionally with int8 dynamically quantized linear layers."""
+    if quantize not in QUANTIZE_OPTIONS:
+        raise ValueError(f"Unsupported quantization {quantize!r}, expected one of {QUANTIZE_OPTIONS}")
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, trust_remote_code=True)
+    if quantize == 'int8':
+        import torch
+        model = torch.quantization.quantize_dynamic(model.to('cpu'), {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def encode_texts(model, texts):
+    # Same preprocessing as HuggingFaceEmbeddings, so vectors match the ones already stored
+    texts = [text.replace("\n", " ") for text in texts]
+    return model.encode(texts, batch_size=len(texts)).tolist()
+
+def make_length_buckets(texts, batch_size):
+    """Group text indices into batches of similar length so short chunks aren't padded to long ones."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+# State of each embedding worker process
+_WORKER_MODEL = None
+
+def _init_worker(model_name, quantize, num_threads):
+    global _WORKER_MODEL
+    import torch
+    torch.set_num_threads(num_threads)
+    _WORKER_MODEL = load_embedding_model(model_name, quantize)
+
+def _embed_batch(texts):
+    return encode_texts(_WORKER_MODEL, texts)
+
+class EmbeddingEngine(Embeddings):
+    """
+    Batched embedding engine for CPU ingestion.
+    Documents are embedded in length-bucketed batches, spread over num_workers processes when
+    num_workers > 1. Queries are embedded in-process. Throughput is logged for every call.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=EMBEDDING_BATCH_SIZE,
+                 num_workers=EMBEDDING_WORKERS, quantize=EMBEDDING_QUANTIZE):
+        if quantize not in QUANTIZE_OPTIONS:
+            raise ValueError(f"Unsupported quantization {quantize!r}, expected one of {QUANTIZE_OPTIONS}")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_workers = max(1, num_workers)
+        self.quantize = quantize
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+        self.last_throughput = None
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                logger.info(f"Loading embedding model {self.model_name} (quantize={self.quantize})")
+                self._model = load_embedding_model(self.model_name, self.quantize)
+        return self._model
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                num_threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+                logger.info(f"Starting {self.num_workers} embedding workers with {num_threads} thread(s) each")
+                # Spawn rather than fork, torch does not survive forking once its thread pool is up
+                context = multiprocessing.get_context('spawn')
+                self._pool = context.Pool(
+                    self.num_workers,
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.quantize, num_threads)
+                )
+        return self._pool
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        start = time.perf_counter()
+        buckets = make_length_buckets(texts, self.batch_size)
+        batches = [[texts[i] for i in bucket] for bucket in buckets]
+        if self.num_workers > 1 and len(batches) > 1:
+            results = self._get_pool().map(_embed_batch, batches)
+        else:
+            model = self._get_model()
+            results = [encode_texts(model, batch) for batch in batches]
+
+        embeddings = [None] * len(texts)
+        for bucket, vectors in zip(buckets, results):
+            for index, vector in zip(bucket, vectors):
+                embeddings[index] = vector
+
+        elapsed = time.perf_counter() - start
+        self.total_chunks += len(texts)
+        self.total_seconds += elapsed
+        self.last_throughput = len(texts) / elapsed if elapsed > 0 else float('inf')
+        logger.info(f"Embedded {len(texts)} chunks in {elapsed:.2f}s ({self.last_throughput:.1f} chunks/sec)")
+        return embeddings
+
+    def embed_query(self, text):
+        return encode_texts(self._get_model(), [text])[0]
+
+    def throughput(self):
+        """Average chunks per second over everything embedded so far."""
+        return self.total_chunks / self.total_seconds if self.total_seconds > 0 else None
+
+    def close(self):
+        """Stop the worker processes, if any were started."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
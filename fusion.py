@@ -0,0 +1,200 @@
+# fusion.py
+
+import re
+from typing import Any, Optional
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from context_packing import find_overlap, shingles, jaccard, NEAR_DUPLICATE_THRESHOLD
+from retrieval import chunk_id
+from tracing import span
+from config import (
+    FUSION_STRATEGY,
+    FUSION_RRF_C,
+    FUSION_TOP_K,
+    FUSION_FETCH_K,
+    FUSION_DEDUP,
+    FUSION_MMR_LAMBDA,
+    FUSION_QUERY_WEIGHTS
+)
+
+FUSION_STRATEGIES = ('rrf', 'weighted')
+SPAN_OVERLAP_FRACTION = 0.5  # Share of the shorter chunk that must overlap for two chunks to count as one
+
+# Question types, checked in order; the first match picks the weights from FUSION_QUERY_WEIGHTS
+QUERY_TYPES = [
+    ("date", re.compile(r"\b(?:when|date|dated|filed|decided|deadline|year|month|day|(?:19|20)\d{2})\b", re.IGNORECASE)),
+    ("citation", re.compile(r"\b(?:case (?:number|no\.?)|docket|statute|section|article|rule|code)\b|§|\bNo\.\s*\d|\bv\.\s", re.IGNORECASE)),
+    ("conceptual", re.compile(r"\b(?:why|how|explain|reasoning|rationale|argue[sd]?|argument|analy[sz]e|compare|impact)\b", re.IGNORECASE)),
+]
+
+def classify_query(question):
+    for query_type, pattern in QUERY_TYPES:
+        if pattern.search(question):
+            return query_type
+    return "default"
+
+def get_query_weights(question, query_weights=None):
+    """(keyword, vector) fusion weights for the type of question."""
+    query_weights = query_weights or FUSION_QUERY_WEIGHTS
+    return tuple(query_weights.get(classify_query(question), query_weights["default"]))
+
+def fuse_rankings(doc_lists, weights=None, strategy=FUSION_STRATEGY, scores=None, c=FUSION_RRF_C):
+    """
+    Fuse ranked lists of documents into one ranking, keeping each chunk once.
+    'rrf' adds weight / (rank + 1 + c) per list. 'weighted' adds weight times the list's scores
+    min-max normalized to [0, 1]; without scores, 1 - rank / len(list) is used.
+    Returns the documents and their fused scores, best first.
+    """
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy {strategy!r}, expected one of {FUSION_STRATEGIES}")
+    weights = np.asarray(weights if weights is not None else [1.0] * len(doc_lists), dtype=np.float64)
+    positions = {}
+    unique_docs = []
+    rows = []
+    for docs in doc_lists:
+        row = []
+        for doc in docs:
+            cid = chunk_id(doc)
+            if cid not in positions:
+                positions[cid] = len(unique_docs)
+                unique_docs.append(doc)
+            row.append(positions[cid])
+        rows.append(row)
+    if not unique_docs:
+        return [], np.zeros(0)
+
+    # One (lists x chunks) matrix of per-list contributions, zero where a list lacks the chunk
+    contributions = np.zeros((len(doc_lists), len(unique_docs)))
+    for i, row in enumerate(rows):
+        if not row:
+            continue
+        # A chunk listed twice in one list keeps its best rank
+        columns = np.asarray(row)
+        ranks = np.arange(len(row), dtype=np.float64)
+        first = np.unique(columns, return_index=True)[1]
+        columns, ranks = columns[first], ranks[first]
+        if strategy == 'rrf':
+            values = 1.0 / (ranks + 1 + c)
+        elif scores is not None and scores[i] is not None:
+            raw = np.asarray(scores[i], dtype=np.float64)[first]
+            spread = raw.max() - raw.min()
+            values = (raw - raw.min()) / spread if spread > 0 else np.ones_like(raw)
+        else:
+            values = 1.0 - ranks / len(row)
+        contributions[i, columns] = values
+    fused = weights @ contributions
+    # Stable sort so ties keep the order the chunks were first seen in
+    order = np.argsort(-fused, kind="stable")
+    return [unique_docs[i] for i in order], fused[order]
+
+def is_overlapping(doc, other, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """Whether two chunks of the same source and page cover largely the same text span."""
+    if doc.metadata.get("source") != other.metadata.get("source") or doc.metadata.get("page") != other.metadata.get("page"):
+        return False
+    text, other_text = doc.page_content.strip(), other.page_content.strip()
+    if text in other_text or other_text in text:
+        return True
+    shorter = min(len(text), len(other_text)) or 1
+    overlap = max(find_overlap(text, other_text), find_overlap(other_text, text))
+    if overlap / shorter >= SPAN_OVERLAP_FRACTION:
+        return True
+    return jaccard(shingles(text), shingles(other_text)) >= threshold
+
+def dedup_documents(docs, scores=None, limit=None):
+    """Drop chunks overlapping a better-ranked chunk of the same page. Docs must be best first."""
+    kept, kept_scores = [], []
+    for i, doc in enumerate(docs):
+        if any(is_overlapping(doc, other) for other in kept):
+            continue
+        kept.append(doc)
+        kept_scores.append(scores[i] if scores is not None else 0.0)
+        if limit and len(kept) >= limit:
+            break
+    return kept, np.asarray(kept_scores)
+
+def mmr_select(relevance, embeddings, k, lambda_mult=0.7):
+    """
+    Maximal marginal relevance: greedily pick k indices, trading relevance against cosine
+    similarity to what was already picked. Returns the picked indices in order.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if not len(embeddings):
+        return []
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = embeddings / norms
+    relevance = np.asarray(relevance, dtype=np.float64)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+    similarity = embeddings @ embeddings.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(relevance)):
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        mmr[selected] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+def keyword_search(bm25_retriever, query, k):
+    """Top k chunks of a BM25 index with their scores, scored over the whole index at once."""
+    scores = np.asarray(bm25_retriever.vectorizer.get_scores(bm25_retriever.preprocess_func(query)))
+    k = min(k, len(scores))
+    if k <= 0:
+        return [], []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [bm25_retriever.docs[i] for i in top], scores[top].tolist()
+
+class HybridRetriever(BaseRetriever):
+    """
+    Keyword (BM25) and vector retrieval fused natively instead of through EnsembleRetriever.
+    Candidates from both are fused with reciprocal-rank or weighted-score fusion, weighted by
+    question type, overlapping chunks of the same page are dropped and an optional MMR pass
+    diversifies the result. Any setting can be overridden per call, e.g.
+    retriever.invoke(question, weights=(0.9, 0.1), k=5, mmr_lambda=0.7).
+    """
+
+    keyword_retriever: Any
+    vector_store: Any
+    k: int = FUSION_TOP_K
+    fetch_k: int = FUSION_FETCH_K
+    strategy: str = FUSION_STRATEGY
+    weights: Optional[tuple] = None  # Fixed weights; None picks them by question type
+    query_weights: Optional[dict] = None
+    dedup: bool = FUSION_DEDUP
+    mmr_lambda: Optional[float] = FUSION_MMR_LAMBDA
+
+    def _get_relevant_documents(self, query, *, run_manager=None, k=None, weights=None, strategy=None, mmr_lambda=None):
+        k = k or self.k
+        fetch_k = max(self.fetch_k, k)
+        weights = weights or self.weights or get_query_weights(query, self.query_weights)
+        strategy = strategy or self.strategy
+        mmr_lambda = mmr_lambda if mmr_lambda is not None else self.mmr_lambda
+
+        with span("keyword_search"):
+            keyword_docs, keyword_scores = keyword_search(self.keyword_retriever, query, fetch_k)
+        with span("vector_search"):
+            vector_results = self.vector_store.similarity_search_with_relevance_scores(query, k=fetch_k)
+        vector_docs = [doc for doc, _ in vector_results]
+        vector_scores = [score for _, score in vector_results]
+
+        with span("fusion", strategy=strategy, candidates=len(keyword_docs) + len(vector_docs)):
+            docs, scores = fuse_rankings(
+                [keyword_docs, vector_docs],
+                weights=weights,
+                strategy=strategy,
+                scores=[keyword_scores, vector_scores]
+            )
+            # MMR needs a pool to choose from, otherwise stop as soon as k distinct chunks are found
+            limit = None if mmr_lambda is not None else k
+            if self.dedup:
+                docs, scores = dedup_documents(docs, scores, limit=limit)
+        if mmr_lambda is None or len(docs) <= k:
+            return docs[:k]
+        with span("mmr"):
+            # Chunk embeddings come from the embedding cache filled at ingest time
+            embeddings = self.vector_store.embeddings.embed_documents([doc.page_content for doc in docs])
+            return [docs[i] for i in mmr_select(scores, embeddings, k, mmr_lambda)]
@@ -1,20 +1,95 @@
 # llm_interface.py
 
-from langchain_community.chat_models import ChatOllama, ChatOpenAI
-from config import MODEL_NAME
+import time
+import threading
+from config import MODEL_NAME, OLLAMA_KEEP_ALIVE
+from tracing import span, record_llm_tokens
 from logging_config import logger
 
-def setup_llm(model_name=MODEL_NAME):
-    logger.info(f"Setting up LLM with model name: {model_name}")
-    return ChatOllama(model=model_name, temperature=0.2)
+LLM_ERROR_MESSAGE = "Error in generating response from LLM."
 
+# Chat clients are shared across calls, so the HTTP connection pool is reused
+_LLM_CLIENTS = {}
+_LLM_LOCK = threading.Lock()
+# Chat model used instead of Ollama when set, e.g. a local stand-in for benchmarks
+_LLM_OVERRIDE = None
 
-def invoke_llm(prompt):
-    """Wrapper for LLM invocation with error handling."""
-    try:
-        llm = setup_llm()  # This function sets up the LLM model instance
-        response = llm.invoke(prompt)  # Calls the model to generate the response
-        return response.content.strip()  # Strips and returns the content of the response
-    except Exception as e:
-        logger.error(f"Error invoking LLM: {str(e)}")
-        return "Error in generating response from LLM."
+def set_llm(llm):
+    """Route every LLM call to this chat model (anything with invoke and stream). None restores Ollama."""
+    global _LLM_OVERRIDE
+    with _LLM_LOCK:
+        _LLM_OVERRIDE = llm
+
+def setup_llm(model_name=MODEL_NAME, temperature=0.2, **kwargs):
+    """Return the shared chat client for this model and parameters, creating it on first use."""
+    key = (model_name, temperature, tuple(sorted(kwargs.items())))
+    with _LLM_LOCK:
+        if _LLM_OVERRIDE is not None:
+            return _LLM_OVERRIDE
+        llm = _LLM_CLIENTS.get(key)
+        if llm is None:
+            from langchain_ollama import ChatOllama
+
+            logger.info(f"Setting up LLM with model name: {model_name}")
+            # keep_alive keeps the model loaded in Ollama between calls
+            llm = ChatOllama(model=model_name, temperature=temperature, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs)
+            _LLM_CLIENTS[key] = llm
+    return llm
+
+
+def count_llm_tokens(prompt, output, usage=None):
+    """Input and output token counts, as reported by the backend or else estimated with tiktoken."""
+    if usage and usage.get("input_tokens") is not None:
+        return usage["input_tokens"], usage.get("output_tokens", 0)
+    from context_packing import count_tokens
+    return count_tokens(str(prompt)), count_tokens(output)
+
+
+def invoke_llm(prompt, stage="invoke"):
+    """Wrapper for LLM invocation with error handling. The call is traced as llm.<stage>."""
+    with span(f"llm.{stage}") as attributes:
+        try:
+            llm = setup_llm()  # Returns the shared LLM client
+            response = llm.invoke(prompt)  # Calls the model to generate the response
+            content = response.content.strip()  # Strips the content of the response
+            record_llm_tokens(attributes, *count_llm_tokens(prompt, content, getattr(response, "usage_metadata", None)))
+            return content
+        except Exception as e:
+            logger.error(f"Error invoking LLM: {str(e)}")
+            attributes["error"] = str(e)
+            return LLM_ERROR_MESSAGE
+
+
+def stream_llm(prompt, stage="stream"):
+    """
+    Yield the response tokens as they arrive from the model, with the same error handling as invoke_llm.
+    The call is traced as llm.<stage>, including the time to the first token.
+    """
+    with span(f"llm.{stage}") as attributes:
+        start = time.perf_counter()
+        tokens = []
+        usage = None
+        try:
+            llm = setup_llm()
+            for chunk in llm.stream(prompt):
+                # The backend reports token usage on the last chunk
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if chunk.content:
+                    if not tokens:
+                        attributes["first_token_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                    tokens.append(chunk.content)
+                    yield chunk.content
+        except Exception as e:
+            logger.error(f"Error streaming from LLM: {str(e)}")
+            attributes["error"] = str(e)
+            yield LLM_ERROR_MESSAGE
+        record_llm_tokens(attributes, *count_llm_tokens(prompt, "".join(tokens), usage))
+
+
+def stream_llm_section(section, prompt):
+    """Yield (section, token) pairs for the response and return the full response text."""
+    tokens = []
+    for token in stream_llm(prompt, stage=section):
+        tokens.append(token)
+        yield section, token
+    return "".join(tokens).strip()
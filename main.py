@@ -1,26 +1,33 @@
 # main.py
 
-from document_processing import (
-    load_documents_from_directory,
-    load_documents_from_markdown
-)
-from retrieval import load_or_create_vector_store
-from summarizer import refine_question, summarize_case
-from chatbot import answer_question
-from config import COLLECTION_NAME, PERSIST_DIRECTORY
+from corpus import get_corpus
+from summarizer import refine_question, summarize_case, stream_summarize_case, summarize_case_map_reduce, SUMMARY_SECTIONS
+from chatbot import answer_question, stream_answer_question, refine_with_speculative_retrieval
+from chat_session import ChatSession
+from config import COLLECTION_NAME, PERSIST_DIRECTORY, DOCUMENT_PATH, SPECULATIVE_RETRIEVAL, STREAM_OUTPUT, METADATA_ROUTING
+from case_metadata import answer_from_metadata
+from tracing import trace, export_metrics
 from logging_config import logger
 
-def main():
-    document_path = 'docs/law-data/case2'  # Specify path (Markdown or PDF)
+def print_stream(events, titles):
+    """Print streamed tokens under a header per section as they arrive and return the final result."""
+    current_section = None
+    for section, value in events:
+        if section == "result":
+            print()
+            return value
+        if section != current_section:
+            current_section = section
+            print(f"\n--- {titles[section]} ---")
+        print(value, end="", flush=True)
 
-    # Load and preprocess documents
-    if document_path.endswith('.md'):
-        documents = load_documents_from_markdown(document_path)
-    else:
-        documents = load_documents_from_directory(document_path)
+def main():
+    document_path = DOCUMENT_PATH  # Specify path (Markdown or PDF) in config.py
 
-    # Load or create vector store
-    vector_store = load_or_create_vector_store(documents)
+    # Load and preprocess documents, then load or update the vector store and keyword index
+    corpus = get_corpus(document_path)
+    documents = corpus.documents
+    vector_store = corpus.vector_store
 
     # User interaction loop
     while True:
@@ -28,41 +35,99 @@ def main():
         print("Select an option:")
         print("1. Ask a question (Q&A)")
         print("2. Summarize a case")
-        print("3. Exit")
-        choice = input("Enter your choice (1/2/3): ")
+        print("3. Summarize the entire case file")
+        print("4. Chat about the case (follow-up questions)")
+        print("5. Exit")
+        choice = input("Enter your choice (1/2/3/4/5): ")
 
         if choice == '1':
             question = input("Enter your legal question: ")
-            refined_question = refine_question(question)
-            logger.info(f"Refined question: {refined_question}")
-            result = answer_question(refined_question, documents, vector_store)
-            print("\n--- Answer ---")
-            print(result['answer'])
-            print("\n--- Sources ---")
-            for item in result['structured_context']:
-                print(f"File: {item['file_name']}, Page: {item['page_number']}")
+            with trace("qa", question=question):
+                # Factual questions the metadata index can answer skip refinement and the LLM entirely
+                result = answer_from_metadata(question) if METADATA_ROUTING else None
+                if result is not None:
+                    print("\n--- Answer ---")
+                    print(result['answer'])
+                    print("\n--- Sources ---")
+                    for item in result['structured_context']:
+                        print(f"File: {item['file_name']}, Page: {item['page_number']}")
+                    continue
+
+                retrieved_docs = None
+                if SPECULATIVE_RETRIEVAL:
+                    refined_question, retrieved_docs = refine_with_speculative_retrieval(question, documents, vector_store)
+                else:
+                    refined_question = refine_question(question)
+                logger.info(f"Refined question: {refined_question}")
+                if STREAM_OUTPUT:
+                    events = stream_answer_question(refined_question, documents, vector_store, retrieved_docs=retrieved_docs)
+                    result = print_stream(events, {"answer": "Answer"})
+                else:
+                    result = answer_question(refined_question, documents, vector_store, retrieved_docs=retrieved_docs)
+                    print("\n--- Answer ---")
+                    print(result['answer'])
+                print("\n--- Sources ---")
+                for item in result['structured_context']:
+                    print(f"File: {item['file_name']}, Page: {item['page_number']}")
 
         elif choice == '2':
             question = input("Enter your request for case summarization: ")
-            refined_question = refine_question(question)
-            logger.info(f"Refined question: {refined_question}")
-            result = summarize_case(refined_question, documents, vector_store)
+            with trace("summary", question=question):
+                retrieved_docs = None
+                if SPECULATIVE_RETRIEVAL:
+                    refined_question, retrieved_docs = refine_with_speculative_retrieval(question, documents, vector_store)
+                else:
+                    refined_question = refine_question(question)
+                logger.info(f"Refined question: {refined_question}")
+                if STREAM_OUTPUT:
+                    events = stream_summarize_case(refined_question, documents, vector_store, retrieved_docs=retrieved_docs)
+                    result = print_stream(events, SUMMARY_SECTIONS)
+                else:
+                    result = summarize_case(refined_question, documents, vector_store, retrieved_docs=retrieved_docs)
 
-            print("\n--- Initial Findings ---")
-            print(result['initial_findings'])
-            print("\n--- Follow-up Information ---")
-            print(result['followup_info'])
-            print("\n--- Final Summary ---")
-            print(result['final_summary'])
-            print("\n--- Sources ---")
-            for item in result['structured_context']:
-                print(f"File: {item['file_name']}, Page: {item['page_number']}")
+                    print("\n--- Initial Findings ---")
+                    print(result['initial_findings'])
+                    print("\n--- Follow-up Information ---")
+                    print(result['followup_info'])
+                    print("\n--- Final Summary ---")
+                    print(result['final_summary'])
+                print("\n--- Sources ---")
+                for item in result['structured_context']:
+                    print(f"File: {item['file_name']}, Page: {item['page_number']}")
 
         elif choice == '3':
+            with trace("case_summary"):
+                result = summarize_case_map_reduce(documents)
+                for file_name, summary in result['file_summaries'].items():
+                    print(f"\n--- {file_name} ---")
+                    print(summary)
+                print("\n--- Case Summary ---")
+                print(result['final_summary'])
+
+        elif choice == '4':
+            # Questions are asked as written: refining them would lose references to earlier turns
+            session = ChatSession(documents, vector_store)
+            while True:
+                question = input("\nYou (empty line to go back): ").strip()
+                if not question:
+                    break
+                with trace("chat", question=question):
+                    if STREAM_OUTPUT:
+                        result = print_stream(session.stream(question), {"answer": "Answer"})
+                    else:
+                        result = session.ask(question)
+                        print("\n--- Answer ---")
+                        print(result['answer'])
+                    print("\n--- Sources ---")
+                    for item in result['structured_context']:
+                        print(f"File: {item['file_name']}, Page: {item['page_number']}")
+
+        elif choice == '5':
+            export_metrics()
             print("Exiting...")
             break
         else:
-            print("Invalid choice. Please select 1, 2, or 3.")
+            print("Invalid choice. Please select 1, 2, 3, 4, or 5.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,325 @@
+# numpy_store.py
+
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from config import VECTOR_QUANTIZATION
+from logging_config import logger
+
+VECTORS_FILE = "vectors.npy"
+QUANTIZED_FILE = "vectors_quantized.npy"
+SCALES_FILE = "vectors_scales.npy"
+RECORDS_FILE = "records.json"
+QUANTIZATION_OPTIONS = (None, 'float16', 'int8')
+RESCORE_FACTOR = 8  # Candidates taken from the quantized pass per requested result
+BLOCK_ROWS = 65536  # Rows scored at a time in the quantized pass
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def quantize(matrix, quantization):
+    """Quantized copy of the normalized vectors for the first search pass, with per-row scales for int8."""
+    if quantization == 'float16':
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+def _save_array(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+class _Snapshot:
+    """
+    The records and vectors of one saved version, with source codes and pages as arrays so
+    filters are vectorized. Never modified: a save builds a new one, so a search reads one
+    consistent version however the store changes meanwhile.
+    """
+
+    def __init__(self, ids, texts, metadatas, vectors, quantized=None, scales=None):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.quantized = quantized
+        self.scales = scales
+        self.sources = sorted({str(m.get("source", "")) for m in metadatas})
+        source_codes = {source: code for code, source in enumerate(self.sources)}
+        self.source_codes = np.array([source_codes[str(m.get("source", ""))] for m in metadatas], dtype=np.int32)
+        self.pages = np.array([int(m.get("page", -1)) if str(m.get("page", "")).lstrip("-").isdigit() else -1
+                               for m in metadatas], dtype=np.int64)
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store for single cases and small corpora.
+    Normalized float32 embeddings live in a memory-mapped .npy file, so several processes can
+    share one copy, and top-k is one vectorized dot product. Results can be filtered on source
+    and page (a value or a list of values). With quantization set, a float16 or int8 copy is
+    scanned first and the best candidates are rescored exactly against the float32 vectors.
+    Every add or delete writes a new version of the files; inside bulk_update() they are written
+    once at the end. Searches read an immutable snapshot and take no lock.
+    """
+
+    def __init__(self, persist_directory, embedding_function, quantization=VECTOR_QUANTIZATION):
+        if quantization not in QUANTIZATION_OPTIONS:
+            raise ValueError(f"Unsupported quantization {quantization!r}, expected one of {QUANTIZATION_OPTIONS}")
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.quantization = quantization
+        self._lock = threading.Lock()
+        self._pending = None  # Changes collected inside bulk_update()
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _path(self, name):
+        return os.path.join(self.persist_directory, name)
+
+    def _file(self, name, version):
+        """Path of a vector file; each save writes a new version, so mapped files are never replaced."""
+        if version is None:  # Stores written before files were versioned
+            return self._path(name)
+        stem, extension = os.path.splitext(name)
+        return self._path(f"{stem}-{version}{extension}")
+
+    def _load(self):
+        """Read the stored records and map the vectors, then make them current in one assignment."""
+        records_path = self._path(RECORDS_FILE)
+        records = {"ids": [], "texts": [], "metadatas": []}
+        vectors = np.zeros((0, 0), dtype=np.float32)
+        if os.path.exists(records_path):
+            with open(records_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            # Empty files can't be memory-mapped
+            if records["ids"]:
+                vectors = np.load(self._file(VECTORS_FILE, records.get("version")), mmap_mode="r")
+        quantized, scales = None, None
+        if self.quantization and records["ids"]:
+            version = records.get("version")
+            quantized_path = self._file(QUANTIZED_FILE, version)
+            if not os.path.exists(quantized_path):
+                quantized, scales = quantize(np.asarray(vectors), self.quantization)
+                _save_array(quantized_path, quantized)
+                if scales is not None:
+                    _save_array(self._file(SCALES_FILE, version), scales)
+            quantized = np.load(quantized_path, mmap_mode="r")
+            scales = np.load(self._file(SCALES_FILE, version)) if self.quantization == 'int8' else None
+        self._state = _Snapshot(records["ids"], records["texts"], records["metadatas"], vectors, quantized, scales)
+
+    def _save(self, ids, texts, metadatas, vectors):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        # New files under a new version; searches in flight keep reading the old ones
+        version = f"v{time.time_ns()}"
+        _save_array(self._file(VECTORS_FILE, version), vectors.astype(np.float32))
+        tmp_path = self._path(f"{RECORDS_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "texts": texts, "metadatas": metadatas, "version": version}, f)
+        # Switching the records is what makes the new version current
+        os.replace(tmp_path, self._path(RECORDS_FILE))
+        self._load()
+        self._remove_old_versions(version)
+
+    def _remove_old_versions(self, version):
+        """Delete the vector files of earlier versions; files still mapped (on Windows) are left for the next save."""
+        current = {os.path.basename(self._file(name, version)) for name in (VECTORS_FILE, QUANTIZED_FILE, SCALES_FILE)}
+        prefixes = tuple(os.path.splitext(name)[0] for name in (VECTORS_FILE, QUANTIZED_FILE, SCALES_FILE))
+        for name in os.listdir(self.persist_directory):
+            if name.endswith(".npy") and name.startswith(prefixes) and name not in current:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def bulk_update(self):
+        """Collect the adds and deletes made inside the block and write the store once when it ends."""
+        with self._lock:
+            self._pending = []
+        try:
+            yield self
+        finally:
+            with self._lock:
+                operations, self._pending = self._pending, None
+                if operations:
+                    self._apply(operations)
+
+    def _apply(self, operations):
+        """Write the result of a list of ("add", ids, texts, metadatas, embeddings) and ("delete", ids) operations."""
+        # id -> (batch, row); batch -1 is the stored vectors. Re-adding an id moves it to the end.
+        state = self._state
+        rows = {existing: (-1, i) for i, existing in enumerate(state.ids)}
+        batches = []
+        for operation in operations:
+            if operation[0] == "delete":
+                for removed in operation[1]:
+                    rows.pop(removed, None)
+                continue
+            _, ids, texts, metadatas, embeddings = operation
+            batches.append((texts, metadatas, embeddings))
+            for row, added in enumerate(ids):
+                rows.pop(added, None)
+                rows[added] = (len(batches) - 1, row)
+
+        dimensions = state.vectors.shape[1] if len(state.ids) else next((b[2].shape[1] for b in batches), 0)
+        stored = np.asarray(state.vectors) if len(state.ids) else np.zeros((0, dimensions), dtype=np.float32)
+        sources = [stored] + [embeddings for _, _, embeddings in batches]
+        offsets = np.cumsum([0] + [len(source) for source in sources])
+        # One gather over all stored and new vectors instead of a copy per batch
+        stacked = np.vstack(sources) if len(sources) > 1 else stored
+        order = np.array([offsets[batch + 1] + row for batch, row in rows.values()], dtype=np.int64)
+        texts = [state.texts[row] if batch < 0 else batches[batch][0][row] for batch, row in rows.values()]
+        metadatas = [state.metadatas[row] if batch < 0 else batches[batch][1][row] for batch, row in rows.values()]
+        vectors = stacked[order] if len(order) else np.zeros((0, dimensions), dtype=np.float32)
+        self._save(list(rows), texts, metadatas, vectors)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        embeddings = normalize_rows(np.asarray(self._embedding_function.embed_documents(texts), dtype=np.float32))
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("add", ids, texts, metadatas, embeddings))
+                return ids
+            # Adding an existing id replaces it, like Chroma's upsert
+            state = self._state
+            replaced = set(ids)
+            keep = [i for i, existing in enumerate(state.ids) if existing not in replaced]
+            vectors = np.asarray(state.vectors)[keep] if len(keep) else np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            self._save(
+                [state.ids[i] for i in keep] + ids,
+                [state.texts[i] for i in keep] + texts,
+                [state.metadatas[i] for i in keep] + metadatas,
+                np.vstack([vectors, embeddings])
+            )
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        removed = set(ids)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("delete", list(ids)))
+                return True
+            state = self._state
+            keep = [i for i, existing in enumerate(state.ids) if existing not in removed]
+            if len(keep) == len(state.ids):
+                return False
+            vectors = np.asarray(state.vectors)[keep] if len(keep) else np.zeros((0, state.vectors.shape[1]), dtype=np.float32)
+            self._save(
+                [state.ids[i] for i in keep],
+                [state.texts[i] for i in keep],
+                [state.metadatas[i] for i in keep],
+                vectors
+            )
+        return True
+
+    def close(self):
+        """Drop the memory-mapped vectors and the records; the store can't be searched afterwards."""
+        with self._lock:
+            self._state = _Snapshot([], [], [], np.zeros((0, 0), dtype=np.float32))
+
+    def get(self, ids=None, include=None, **kwargs):
+        """Chroma-style get, enough for the ingest code to list what is stored."""
+        stored = self._state.ids
+        return {"ids": list(stored) if ids is None else [i for i in stored if i in set(ids)]}
+
+    def _filter_mask(self, state, filter):
+        if not filter:
+            return None
+        mask = np.ones(len(state.ids), dtype=bool)
+        for key, value in filter.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if key == "source":
+                codes = [state.sources.index(str(v)) for v in values if str(v) in state.sources]
+                mask &= np.isin(state.source_codes, codes)
+            elif key == "page":
+                # Pages that aren't whole numbers can't match any stored page
+                pages = [int(v) for v in values if str(v).lstrip("-").isdigit()]
+                mask &= np.isin(state.pages, pages)
+            else:
+                mask &= np.array([m.get(key) in values for m in state.metadatas], dtype=bool)
+        return mask
+
+    def _top_k(self, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _search(self, state, query_vector, k, filter=None):
+        """Indices into state and cosine scores of the k best matches."""
+        if not len(state.ids):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm > 0 else query
+        mask = self._filter_mask(state, filter)
+
+        if state.quantized is None:
+            scores = np.asarray(state.vectors @ query)
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+            top = self._top_k(scores, k)
+        else:
+            # First pass over the quantized copy in blocks, then exact rescoring of the candidates
+            approx = np.empty(len(state.ids), dtype=np.float32)
+            for start in range(0, len(state.ids), BLOCK_ROWS):
+                block = np.asarray(state.quantized[start:start + BLOCK_ROWS], dtype=np.float32)
+                if state.scales is not None:
+                    block *= state.scales[start:start + BLOCK_ROWS, None]
+                approx[start:start + BLOCK_ROWS] = block @ query
+            if mask is not None:
+                approx = np.where(mask, approx, -np.inf)
+            candidates = np.sort(self._top_k(approx, k * RESCORE_FACTOR))
+            # With fewer matches than candidates, filtered-out rows are picked too and must not be rescored
+            candidates = candidates[np.isfinite(approx[candidates])]
+            exact = np.asarray(state.vectors[candidates]) @ query
+            scores = np.full(len(state.ids), -np.inf, dtype=np.float32)
+            scores[candidates] = exact
+            top = self._top_k(scores, k)
+        return [(int(i), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def _to_document(self, state, index):
+        return Document(page_content=state.texts[index], metadata=dict(state.metadatas[index]))
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        # One snapshot for the whole search, so a concurrent add or delete can't mix versions
+        state = self._state
+        return [(self._to_document(state, i), score) for i, score in self._search(state, embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] to a relevance score in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory=None, **kwargs):
+        store = cls(persist_directory=persist_directory, embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        logger.info(f"Created NumPy vector store with {len(store._state.ids)} chunks in {persist_directory}")
+        return store
@@ -0,0 +1,166 @@
+# ocr.py
+
+import os
+import re
+import shutil
+import hashlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from config import OCR_CACHE_DIR, OCR_WORKERS, OCR_DPI, OCR_LANGUAGE, OCR_MIN_CHARS, OCR_MIN_READABLE_RATIO
+from tracing import span
+from logging_config import logger
+
+# A token reads as text if it has a run of letters (in any script) or a digit in it
+READABLE_TOKEN = re.compile(r"[^\W\d_]{2,}|\d")
+
+def needs_ocr(text, min_chars=OCR_MIN_CHARS, min_readable_ratio=OCR_MIN_READABLE_RATIO):
+    """
+    Whether a page's text layer is missing or unusable: almost no text (a scan), or mostly
+    tokens that are not words or numbers (a broken font encoding or a poor embedded OCR layer).
+    """
+    tokens = text.split()
+    if sum(len(token) for token in tokens) < min_chars:
+        return True
+    readable = sum(1 for token in tokens if READABLE_TOKEN.search(token))
+    return readable / len(tokens) < min_readable_ratio
+
+def _hash_xobjects(digest, resources, seen):
+    """Add the images and forms a resource dictionary draws to digest, following forms into their own resources."""
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is None:
+        return
+    xobjects = xobjects.get_object()
+    for name in sorted(xobjects):
+        xobject = xobjects[name].get_object()
+        digest.update(name.encode("utf-8"))
+        digest.update(xobject.get_data())
+        # A form is drawn from its own resources, where the scanned image often sits
+        if xobject.get("/Subtype") == "/Form" and id(xobject) not in seen:
+            seen.add(id(xobject))
+            _hash_xobjects(digest, xobject.get("/Resources"), seen)
+
+def page_digest(page):
+    """Hash of what a PDF page draws: its content stream, embedded images (also inside forms) and rotation."""
+    digest = hashlib.sha256(str(page.get("/Rotate", 0)).encode("ascii"))
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    _hash_xobjects(digest, page.get("/Resources"), set())
+    return digest.hexdigest()
+
+def page_digests(file_path, page_numbers):
+    """Digests of the given 0-based pages of a PDF, read without rendering anything."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    return {page_number: page_digest(reader.pages[page_number]) for page_number in page_numbers}
+
+@lru_cache(maxsize=None)
+def ocr_available():
+    """Whether the tesseract and poppler (pdftoppm) binaries OCR needs are installed. Checked once."""
+    missing = [binary for binary in ("tesseract", "pdftoppm") if shutil.which(binary) is None]
+    if missing:
+        logger.warning(f"OCR is disabled: {', '.join(missing)} not found on PATH (see README.md).")
+        return False
+    return True
+
+def ocr_cache_path(digest, cache_dir=OCR_CACHE_DIR, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    # Text depends on the rendering and language as well as the page
+    namespace = re.sub(r"[^a-zA-Z0-9_.\-+]", "_", f"{language}-{dpi}")
+    return os.path.join(cache_dir, namespace, digest[:2], f"{digest}.txt")
+
+def read_cached_text(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def write_cached_text(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _limit_tesseract_threads():
+    # Pages are already OCRed in parallel; tesseract's own threads would only compete with them
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def ocr_page(file_path, page_number, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    """Render one 0-based page of a PDF and OCR it. Runs inside the worker processes."""
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number + 1, last_page=page_number + 1, grayscale=True)
+    return pytesseract.image_to_string(images[0], lang=language) if images else ""
+
+def ocr_scanned_pages(pages, workers=OCR_WORKERS, cache_dir=OCR_CACHE_DIR, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    """
+    Replace the text of PDF pages (unsplit, as parsed by PyPDFLoader.load) whose text layer is
+    empty or unusable with OCR output. Only those pages are rendered and OCRed, in parallel
+    across a process pool, and the text is cached per page digest so re-ingesting a folder,
+    or the same scan filed twice, never OCRs a page again. OCRed pages get metadata["ocr"] = True.
+    Pages that can't be OCRed (e.g. a page poppler fails to render) keep their text layer and get
+    metadata["ocr_failed"] = True; failures are not cached, so they are tried again next time.
+    Without tesseract or poppler installed pages are left as they are, as if OCR were off.
+    """
+    if not ocr_available():
+        return pages
+    candidates = [page for page in pages if needs_ocr(page.page_content)]
+    if not candidates:
+        return pages
+
+    with span("ocr", pages=len(candidates)) as attributes:
+        # Digests are read per file, and the pages are located by them in the cache
+        page_numbers = {}
+        for page in candidates:
+            page_numbers.setdefault(page.metadata["source"], []).append(int(page.metadata["page"]))
+        digests = {}
+        for file_path, numbers in page_numbers.items():
+            try:
+                for page_number, digest in page_digests(file_path, numbers).items():
+                    digests[(file_path, page_number)] = digest
+            except Exception as e:
+                logger.warning(f"Could not read {file_path} for OCR: {str(e)}")
+
+        texts = {}
+        misses = []
+        for key, digest in digests.items():
+            text = read_cached_text(ocr_cache_path(digest, cache_dir, dpi, language))
+            if text is None:
+                misses.append(key)
+            else:
+                texts[key] = text
+        attributes["cached"] = len(texts)
+        logger.info(f"{len(candidates)} page(s) need OCR: {len(texts)} cached, {len(misses)} to OCR.")
+
+        if misses:
+            workers = max(1, min(workers or 1, len(misses)))
+            # Always in worker processes, even for one page, so the thread limit never reaches this process
+            with ProcessPoolExecutor(max_workers=workers, initializer=_limit_tesseract_threads) as executor:
+                results = list(executor.map(
+                    _try_ocr_page, *zip(*misses), [dpi] * len(misses), [language] * len(misses)
+                ))
+            for key, text in zip(misses, results):
+                if text is None:
+                    continue
+                texts[key] = text
+                write_cached_text(ocr_cache_path(digests[key], cache_dir, dpi, language), text)
+            attributes["ocr_pages"] = sum(text is not None for text in results)
+
+        for page in candidates:
+            text = texts.get((page.metadata["source"], int(page.metadata["page"])))
+            if text is None:
+                page.metadata["ocr_failed"] = True
+            elif text.strip():
+                page.page_content = text
+                page.metadata["ocr"] = True
+    return pages
+
+def _try_ocr_page(file_path, page_number, dpi, language):
+    """ocr_page, returning None instead of raising so one bad page doesn't fail the folder."""
+    try:
+        return ocr_page(file_path, page_number, dpi, language)
+    except Exception as e:
+        logger.warning(f"OCR failed for page {page_number + 1} of {file_path}: {str(e)}")
+        return None
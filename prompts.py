@@ -1,4 +1,4 @@
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
 
 def refine_question_prompt():
     return PromptTemplate(
@@ -128,9 +128,19 @@ def qa_prompt():
 
 
 def conversational_qa_prompt():
+    # Parts that change least come first, so consecutive turns share a byte-identical prefix
+    # that Ollama can reuse from its prompt cache: the summary and context only change when
+    # history is compressed or new chunks are retrieved, and past turns are only appended to.
     return PromptTemplate(
         template="""
-        You are a helpful legal assistant. Use the conversation history and the provided context to answer the user's question.
+        You are a helpful legal assistant. Use the conversation so far and the provided context to answer the user's question.
+        If the answer is not in the context or the conversation, respond with "I don't know."
+
+        Summary of Earlier Conversation:
+        {conversation_summary}
+
+        Context:
+        {context}
 
         Chat History:
         {chat_history}
@@ -138,10 +148,56 @@ def conversational_qa_prompt():
         Question:
         {question}
 
-        Context:
+        Answer:
+        """,
+        input_variables=["conversation_summary", "context", "chat_history", "question"]
+    )
+
+def summarize_history_prompt():
+    return PromptTemplate(
+        template="""
+        Update the running summary of a conversation about a legal case with the turns below.
+        Keep every case name and number, party, court, date and amount that was asked about or answered,
+        and what the user was trying to find out. Be brief.
+
+        Current Summary:
+        {summary}
+
+        New Turns:
+        {turns}
+
+        Updated Summary:
+        """,
+        input_variables=["summary", "turns"]
+    )
+
+
+def summarize_chunk_prompt():
+    return PromptTemplate(
+        template="""
+        Summarize the following excerpt from a legal case file. Keep every case name and number, party, court, date,
+        claim, ruling, and amount exactly as written, and note the file and page they come from.
+        Do not add information that is not in the excerpt.
+
+        Excerpt:
         {context}
 
-        Answer:
+        Summary:
+        """,
+        input_variables=["context"]
+    )
+
+def reduce_summaries_prompt():
+    return PromptTemplate(
+        template="""
+        Combine the following partial summaries of the same legal case file into a single, consistent summary.
+        Merge repeated facts, keep every case name and number, party, court, date, claim, ruling, and amount exactly as written,
+        and keep the events in chronological order. Do not add information that is not in the summaries.
+
+        Partial Summaries:
+        {summaries}
+
+        Combined Summary:
         """,
-        input_variables=["chat_history", "question", "context"]
+        input_variables=["summaries"]
     )
@@ -1,45 +1,380 @@
 # retrieval.py
 
 import os
-from langchain_community.vectorstores import Chroma
-from langchain.retrievers import BM25Retriever, EnsembleRetriever
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from config import EMBEDDING_MODEL_NAME, PERSIST_DIRECTORY, COLLECTION_NAME
+import json
+import pickle
+import hashlib
+import threading
+from contextlib import nullcontext
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_QUANTIZE,
+    PERSIST_DIRECTORY,
+    COLLECTION_NAME,
+    VECTOR_BACKEND,
+    NUMPY_STORE_DIRECTORY,
+    BM25_INDEX_PATH,
+    METADATA_INDEX_PATH,
+    CHUNK_STORE_DIRECTORY,
+    MANIFEST_PATH,
+    FUSION_RRF_C,
+    FUSION_TOP_K,
+    FUSION_FETCH_K,
+    FUSION_DEDUP
+)
+from embedding_cache import get_cached_embeddings, embedding_model_id
+from chunk_store import ChunkStore
+from case_metadata import build_metadata_index
+from tracing import span
 from logging_config import logger
 
-model_kwargs = {'trust_remote_code': True}
-EMBEDDING_FUNCTION = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, model_kwargs=model_kwargs)
-
-def load_or_create_vector_store(documents):
-    if os.path.exists(PERSIST_DIRECTORY) and len(os.listdir(PERSIST_DIRECTORY)) > 0:
-        logger.info(f"Loading existing vector store from {PERSIST_DIRECTORY}")
-        vector_store = Chroma(
-            persist_directory=PERSIST_DIRECTORY,
-            embedding_function=EMBEDDING_FUNCTION,
-            collection_name=COLLECTION_NAME
-        )
+# The embedding model and the langchain vector store classes are heavy, so they are only
+# imported and loaded the first time something actually needs them
+_EMBEDDING_FUNCTION = None
+_EMBEDDING_LOCK = threading.Lock()
+
+def get_embedding_function():
+    """Return the shared embedding function, loading the model on first use."""
+    global _EMBEDDING_FUNCTION
+    with _EMBEDDING_LOCK:
+        if _EMBEDDING_FUNCTION is None:
+            from embedding_engine import EmbeddingEngine
+            embeddings = EmbeddingEngine(model_name=EMBEDDING_MODEL_NAME, quantize=EMBEDDING_QUANTIZE)
+            # Unchanged chunks are read back from disk instead of being embedded again
+            _EMBEDDING_FUNCTION = get_cached_embeddings(embeddings, model_name=EMBEDDING_MODEL_NAME, quantize=EMBEDDING_QUANTIZE)
+    return _EMBEDDING_FUNCTION
+
+def set_embedding_function(embedding_function):
+    """Use another embedding function everywhere, e.g. a small stand-in for benchmarks. None restores the default."""
+    global _EMBEDDING_FUNCTION
+    with _EMBEDDING_LOCK:
+        _EMBEDDING_FUNCTION = embedding_function
+
+def __getattr__(name):
+    # Keeps `from retrieval import EMBEDDING_FUNCTION` working without loading the model at import time
+    if name == "EMBEDDING_FUNCTION":
+        return get_embedding_function()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# BM25 indexes are built once at ingest time and shared by every retriever afterwards
+_BM25_RETRIEVERS = {}
+_BM25_LOCK = threading.Lock()
+
+def _bm25_source(documents):
+    """
+    What an index was built from: the chunk count and, for a chunk store, which version of it;
+    for a plain list of chunks, their corpus version (see compute_corpus_version).
+    """
+    if isinstance(documents, ChunkStore):
+        return len(documents), documents.directory
+    return len(documents), compute_corpus_version({"files": {"": sorted({chunk_id(doc) for doc in documents})}})
+
+def build_bm25_index(documents, index_path=BM25_INDEX_PATH, k=5):
+    """Build the BM25 keyword index for the documents and save it to disk."""
+    from langchain_community.retrievers import BM25Retriever
+
+    logger.info(f"Building BM25 index for {len(documents)} chunks in {index_path}")
+    with span("bm25_build", chunks=len(documents)):
+        bm25_retriever = BM25Retriever.from_documents(documents)
+        bm25_retriever.k = k
+    if isinstance(documents, ChunkStore):
+        # Hits are read from the memory-mapped chunk store instead of a second copy of every chunk,
+        # and the pickled index only refers to the store
+        bm25_retriever.docs = documents
+    source = _bm25_source(documents)
+
+    index_dir = os.path.dirname(index_path)
+    if index_dir:
+        os.makedirs(index_dir, exist_ok=True)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({"retriever": bm25_retriever, "source": source}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+
+    with _BM25_LOCK:
+        _BM25_RETRIEVERS[index_path] = (bm25_retriever, source)
+    return bm25_retriever
+
+def _read_bm25_index(index_path):
+    """The saved index and its source, or None if it can't be read (e.g. its chunk store version is gone)."""
+    try:
+        with span("bm25_load"), open(index_path, 'rb') as f:
+            saved = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError) as e:
+        logger.warning(f"Could not load the BM25 index in {index_path}: {str(e)}")
+        return None
+    if isinstance(saved, dict):
+        return saved["retriever"], tuple(saved["source"])
+    # Indexes saved before their source was recorded
+    return saved, _bm25_source(saved.docs)
+
+def load_bm25_index(documents=None, index_path=BM25_INDEX_PATH):
+    """
+    Return the shared BM25 index, loading it from disk on first use.
+    Falls back to building it from the documents if no index has been saved yet, or if the
+    saved one was built from other chunks (e.g. the chunk store was rebuilt but indexing was
+    interrupted before the index was).
+    """
+    with _BM25_LOCK:
+        entry = _BM25_RETRIEVERS.get(index_path)
+        if entry is None and os.path.exists(index_path):
+            logger.info(f"Loading BM25 index from {index_path}")
+            entry = _read_bm25_index(index_path)
+            if entry is not None:
+                _BM25_RETRIEVERS[index_path] = entry
+    if entry is not None and (not documents or entry[1] == _bm25_source(documents)):
+        return entry[0]
+
+    if not documents:
+        raise FileNotFoundError(f"No BM25 index found at {index_path} and no documents to build one from.")
+    if entry is not None:
+        logger.info(f"BM25 index in {index_path} is out of date with the chunks, rebuilding it")
+    return build_bm25_index(documents, index_path=index_path)
+
+def unload_bm25_index(index_path=BM25_INDEX_PATH):
+    """Drop a BM25 index from memory; it is loaded from disk again on next use."""
+    with _BM25_LOCK:
+        _BM25_RETRIEVERS.pop(index_path, None)
+
+# Corpus version per manifest, kept in memory once read
+_CORPUS_VERSIONS = {}
+
+def chunk_id(doc):
+    """Content hash identifying a chunk by its source, page and text."""
+    key = "\x00".join([
+        str(doc.metadata.get("source", "")),
+        str(doc.metadata.get("page", "")),
+        doc.page_content
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """Load the ingest manifest, mapping each source file to the ids of its chunks."""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compute_corpus_version(manifest):
+    """Hash of every chunk id in the manifest; changes whenever any chunk is added, changed or removed."""
+    chunk_ids = sorted(cid for ids in manifest["files"].values() for cid in ids)
+    return hashlib.sha256("\n".join(chunk_ids).encode("utf-8")).hexdigest()
+
+def get_corpus_version(manifest_path=MANIFEST_PATH):
+    """Version of the ingested corpus, used to invalidate anything cached against it. None before ingest."""
+    version = _CORPUS_VERSIONS.get(manifest_path)
+    if version is None:
+        manifest = load_manifest(manifest_path)
+        if manifest is None:
+            return None
+        version = manifest.get("version") or compute_corpus_version(manifest)
+        _CORPUS_VERSIONS[manifest_path] = version
+    return version
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    manifest["version"] = compute_corpus_version(manifest)
+    _CORPUS_VERSIONS[manifest_path] = manifest["version"]
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def build_manifest(documents):
+    """Hash every chunk and group the ids by source file. Duplicate chunks are kept once."""
+    files = {}
+    chunks = {}
+    for doc in documents:
+        cid = chunk_id(doc)
+        if cid in chunks:
+            continue
+        chunks[cid] = doc
+        files.setdefault(str(doc.metadata.get("source", "")), []).append(cid)
+    return {"files": files, "embedding": embedding_model_id()}, chunks
+
+def sync_vector_store(vector_store, documents, manifest_path=MANIFEST_PATH, batch_size=1000):
+    """
+    Bring the vector store in line with the documents: embed only added or changed chunks
+    and delete the chunks of removed or changed files. Returns True if anything changed.
+    """
+    manifest, chunks = build_manifest(documents)
+    old_manifest = load_manifest(manifest_path)
+    if old_manifest is not None:
+        stored_ids = {cid for ids in old_manifest["files"].values() for cid in ids}
     else:
-        logger.info(f"Creating new vector store in {PERSIST_DIRECTORY}")
-        vector_store = Chroma.from_documents(
-            documents=documents,
-            embedding=EMBEDDING_FUNCTION,
-            persist_directory=PERSIST_DIRECTORY,
-            collection_name=COLLECTION_NAME
-        )
-        vector_store.persist()
+        # Stores created before the manifest existed use random ids, so they are replaced once
+        stored_ids = set(vector_store.get(include=[])["ids"])
+        if stored_ids:
+            logger.info("No ingest manifest found, re-indexing the existing vector store once.")
+
+    # Vectors of another model or quantization can't be mixed with new ones, so everything is re-embedded.
+    # Manifests from before the model was recorded are taken to match.
+    if old_manifest is not None and old_manifest.get("embedding", manifest["embedding"]) != manifest["embedding"]:
+        logger.info(f"Embedding model changed from {old_manifest['embedding']} to {manifest['embedding']}, re-embedding all chunks.")
+        added_ids = list(chunks)
+        removed_ids = list(stored_ids)
+    else:
+        added_ids = [cid for cid in chunks if cid not in stored_ids]
+        removed_ids = [cid for cid in stored_ids if cid not in chunks]
+
+    # Stores that rewrite their files on every change (the NumPy store) write them once for the whole sync
+    bulk_update = getattr(vector_store, "bulk_update", None)
+    with bulk_update() if bulk_update else nullcontext():
+        if removed_ids:
+            logger.info(f"Deleting {len(removed_ids)} stale chunks from the vector store")
+            with span("vector_delete", chunks=len(removed_ids)):
+                for start in range(0, len(removed_ids), batch_size):
+                    vector_store.delete(ids=removed_ids[start:start + batch_size])
+        if added_ids:
+            logger.info(f"Embedding {len(added_ids)} new or changed chunks")
+            with span("vector_add", chunks=len(added_ids)):
+                for start in range(0, len(added_ids), batch_size):
+                    batch = added_ids[start:start + batch_size]
+                    vector_store.add_documents([chunks[cid] for cid in batch], ids=batch)
+
+    if added_ids or removed_ids or old_manifest is None or "embedding" not in old_manifest:
+        save_manifest(manifest, manifest_path)
+    logger.info(f"Vector store is up to date ({len(chunks)} chunks, {len(added_ids)} added, {len(removed_ids)} removed)")
+    return bool(added_ids or removed_ids)
+
+def get_store_paths(persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    """
+    Locations of a vector store and the indexes saved next to it. The defaults match config.py;
+    case shards derive the same layout from their own directory.
+    """
+    if persist_directory == PERSIST_DIRECTORY:
+        return {
+            "persist_directory": PERSIST_DIRECTORY,
+            "collection_name": collection_name,
+            "numpy_directory": NUMPY_STORE_DIRECTORY,
+            "bm25_index_path": BM25_INDEX_PATH,
+            "manifest_path": MANIFEST_PATH,
+            "metadata_index_path": METADATA_INDEX_PATH,
+            "chunk_store_directory": CHUNK_STORE_DIRECTORY
+        }
+    numpy_directory = f"{persist_directory}_numpy"
+    return {
+        "persist_directory": persist_directory,
+        "collection_name": collection_name,
+        "numpy_directory": numpy_directory,
+        "bm25_index_path": f"{persist_directory}_bm25.pkl",
+        "manifest_path": f"{persist_directory if VECTOR_BACKEND == 'chroma' else numpy_directory}_manifest.json",
+        "metadata_index_path": f"{persist_directory}_metadata.json",
+        "chunk_store_directory": f"{persist_directory}_chunks"
+    }
+
+def open_vector_store(paths=None):
+    """Open the vector store of the configured backend (VECTOR_BACKEND), creating it if needed."""
+    paths = paths or get_store_paths()
+    if VECTOR_BACKEND == 'numpy':
+        from numpy_store import NumpyVectorStore
+
+        logger.info(f"Opening NumPy vector store in {paths['numpy_directory']}")
+        return NumpyVectorStore(persist_directory=paths["numpy_directory"], embedding_function=get_embedding_function())
+    if VECTOR_BACKEND != 'chroma':
+        raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}, expected 'chroma' or 'numpy'")
+
+    from langchain_community.vectorstores import Chroma
+
+    logger.info(f"Opening vector store in {paths['persist_directory']}")
+    return Chroma(
+        persist_directory=paths["persist_directory"],
+        embedding_function=get_embedding_function(),
+        collection_name=paths["collection_name"]
+    )
+
+def close_vector_store(vector_store):
+    """
+    Release the memory an open vector store holds. Chroma keeps the system of every persist
+    directory it opened (segments, HNSW indexes, SQLite) cached until it is stopped.
+    """
+    close = getattr(vector_store, "close", None)
+    if close is not None:
+        close()
+        return
+    client = getattr(vector_store, "_client", None)
+    if client is None:
+        return
+    from chromadb.api.client import SharedSystemClient
+
+    # A private cache of chromadb; if a release renames it, the store is just left open
+    systems = getattr(SharedSystemClient, "_identifer_to_system", None)
+    if systems is None:
+        logger.warning("Could not close the Chroma vector store: this chromadb version has no system cache to clear.")
+        return
+    system = systems.pop(getattr(client, "_identifier", None), None)
+    if system is not None:
+        system.stop()
+
+def load_or_create_vector_store(documents, paths=None):
+    paths = paths or get_store_paths()
+    vector_store = open_vector_store(paths)
+    if documents:
+        changed = sync_vector_store(vector_store, documents, manifest_path=paths["manifest_path"])
+        # Keep the keyword and metadata indexes in step with the chunks that were just ingested
+        if changed:
+            build_bm25_index(documents, index_path=paths["bm25_index_path"])
+        else:
+            # Missing, or built from another version of the chunks
+            load_bm25_index(documents, index_path=paths["bm25_index_path"])
+        if changed or not os.path.exists(paths["metadata_index_path"]):
+            build_metadata_index(documents, index_path=paths["metadata_index_path"])
     return vector_store
 
-def get_hybrid_retriever(documents, vector_store):
+def get_hybrid_retriever(documents, vector_store, bm25_index_path=BM25_INDEX_PATH, **options):
+    """
+    Hybrid keyword and vector retriever with native fusion (see fusion.HybridRetriever).
+    Options such as k, strategy, weights or mmr_lambda override the FUSION_* settings.
+    """
+    from fusion import HybridRetriever
+
     # Use BM25 keyword search, as it's better for questions like "filed", "ruling"
-    bm25_retriever = BM25Retriever.from_documents(documents, search_kwargs={'k': 5})
-    
-    # Vector similarity search for more complex, context-based questions
-    chroma_retriever = vector_store.as_retriever(search_kwargs={'k': 5})
-    
-    # Increase weight for BM25 for date-related queries
-    fusion_retriever = EnsembleRetriever(
-        retrievers=[bm25_retriever, chroma_retriever],
-        weights=[0.8, 0.2]  # Prioritize keyword-based retrieval for date-related questions
-    )
-    return fusion_retriever
+    # The index is prebuilt at ingest time, so this does not re-tokenize the corpus
+    bm25_retriever = load_bm25_index(documents, index_path=bm25_index_path)
+
+    # Vector similarity search for more complex, context-based questions. The keyword/vector
+    # weights follow the question type, leaning on keywords for date questions
+    return HybridRetriever(keyword_retriever=bm25_retriever, vector_store=vector_store, **options)
+
+def merge_retrieved_documents(doc_lists, weights=None, c=FUSION_RRF_C, k=None):
+    """
+    Merge several ranked lists of documents with weighted reciprocal rank fusion,
+    keeping each chunk once. By default returns as many documents as the longest list.
+    """
+    from fusion import fuse_rankings
+
+    docs, _ = fuse_rankings(doc_lists, weights=weights, strategy='rrf', c=c)
+    k = k or max((len(docs) for docs in doc_lists), default=0)
+    return docs[:k]
+
+def batch_hybrid_retrieve(questions, documents, vector_store, k=FUSION_TOP_K, weights=None, bm25_index_path=BM25_INDEX_PATH):
+    """
+    Hybrid retrieval for many questions at once: all questions are embedded in one batched call
+    and scored against the shared BM25 index, then fused and deduplicated like get_hybrid_retriever.
+    Weights default to the question type's. Returns one list of documents per question.
+    """
+    from fusion import fuse_rankings, dedup_documents, keyword_search, get_query_weights
+
+    if not questions:
+        return []
+    bm25_retriever = load_bm25_index(documents, index_path=bm25_index_path)
+    embedding_function = get_embedding_function()
+    # Questions are not worth keeping in the chunk embedding cache, so go straight to the model
+    embedder = getattr(embedding_function, "underlying_embeddings", embedding_function)
+    with span("embed_questions", questions=len(questions)):
+        question_embeddings = embedder.embed_documents(list(questions))
 
+    results = []
+    for question, embedding in zip(questions, question_embeddings):
+        with span("keyword_search"):
+            keyword_docs, _ = keyword_search(bm25_retriever, question, max(FUSION_FETCH_K, k))
+        with span("vector_search"):
+            vector_docs = vector_store.similarity_search_by_vector(embedding, k=max(FUSION_FETCH_K, k))
+        with span("fusion"):
+            docs, scores = fuse_rankings([keyword_docs, vector_docs], weights=weights or get_query_weights(question))
+            if FUSION_DEDUP:
+                docs, scores = dedup_documents(docs, scores, limit=k)
+        results.append(docs[:k])
+    return results
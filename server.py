@@ -0,0 +1,198 @@
+# server.py
+
+"""
+Local HTTP API for Q&A, case summaries and ingestion. All requests share one loaded corpus
+and embedding model. Run with:
+
+    python server.py [--document-path docs/law-data/case2] [--port 8080]
+
+Endpoints:
+    POST /qa         {"question": "..."}  -> {"question", "refined_question", "answer", "structured_context"}
+    POST /summarize  {"question": "..."}  -> {"question", "refined_question", "initial_findings", ...}
+    POST /ingest     {}                   -> {"chunks", "changed"}
+    GET  /cases                           -> {"cases"}
+    GET  /metrics                         -> p50/p95 latency per pipeline stage and token counters
+    GET  /health
+
+/qa also takes "cases": [...] and /summarize "case": "..." to query cases of the archive in
+CASES_DIRECTORY instead of the default corpus; each case is searched in its own shard.
+"""
+
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from corpus import get_corpus
+from chatbot import answer_question, refine_with_speculative_retrieval
+from summarizer import refine_question, summarize_case
+from answer_cache import normalize_question
+from case_shards import CaseShards
+from tracing import trace, METRICS, export_metrics
+from config import DOCUMENT_PATH, SERVER_HOST, SERVER_PORT, LLM_CONCURRENCY, SPECULATIVE_RETRIEVAL
+from logging_config import logger
+
+def refine(question, corpus):
+    """Refine the question, retrieving speculatively in the meantime if enabled."""
+    if SPECULATIVE_RETRIEVAL:
+        return refine_with_speculative_retrieval(question, corpus.documents, corpus.vector_store)
+    return refine_question(question), None
+
+def answer(question, corpus):
+    with trace("qa", question=question):
+        refined_question, retrieved_docs = refine(question, corpus)
+        result = answer_question(refined_question, corpus.documents, corpus.vector_store, retrieved_docs=retrieved_docs)
+    return dict(result, question=question, refined_question=refined_question)
+
+def summarize(question, corpus):
+    with trace("summary", question=question):
+        refined_question, retrieved_docs = refine(question, corpus)
+        result = summarize_case(refined_question, corpus.documents, corpus.vector_store, retrieved_docs=retrieved_docs)
+    return dict(result, question=question, refined_question=refined_question)
+
+def answer_cases(question, shards, cases):
+    with trace("qa", question=question, cases=cases):
+        return shards.answer_question(question, cases)
+
+def summarize_in_case(question, shards, case):
+    with trace("summary", question=question, case=case):
+        return shards.summarize_case(question, case)
+
+def ingest(state):
+    """Refresh the corpus if its files changed, publishing the new one only once it is complete."""
+    corpus = state["corpus"]
+    with trace("ingest", document_path=corpus.document_path):
+        changed = corpus.is_stale()
+        if changed:
+            corpus = corpus.refresh()
+            state["corpus"] = corpus
+    return {"chunks": len(corpus.documents), "changed": changed}
+
+async def run_blocking(app, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(app["executor"], func, *args)
+
+async def run_coalesced(app, key, func, *args):
+    """
+    Run func once per key at a time: identical requests that arrive while it is running
+    wait for the same result instead of starting their own computation.
+    """
+    inflight = app["inflight"]
+    future = inflight.get(key)
+    if future is None:
+        async def run():
+            async with app["llm_semaphore"]:
+                return await run_blocking(app, func, *args)
+
+        future = asyncio.ensure_future(run())
+        inflight[key] = future
+        future.add_done_callback(lambda _: inflight.pop(key, None))
+    else:
+        logger.info(f"Joining in-flight request for {key[0]}")
+    # Shielded so a client disconnecting doesn't cancel the work for the others
+    return await asyncio.shield(future)
+
+async def read_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object.")
+    question = str(body.get("question", "")).strip()
+    if not question:
+        raise web.HTTPBadRequest(text="Missing 'question'.")
+    return question, body
+
+def read_cases(app, cases):
+    """Validate the requested case names against the archive."""
+    if isinstance(cases, str):
+        cases = [cases]
+    if not isinstance(cases, list) or not cases:
+        raise web.HTTPBadRequest(text="'cases' must be a non-empty list of case names.")
+    unknown = sorted(set(map(str, cases)) - set(app["shards"].list_cases()))
+    if unknown:
+        raise web.HTTPNotFound(text=f"Unknown cases: {', '.join(unknown)}")
+    return [str(case) for case in cases]
+
+async def handle_qa(request):
+    app = request.app
+    question, body = await read_body(request)
+    if "cases" in body:
+        cases = read_cases(app, body["cases"])
+        key = ("qa", normalize_question(question), tuple(sorted(cases)))
+        result = await run_coalesced(app, key, answer_cases, question, app["shards"], cases)
+    else:
+        result = await run_coalesced(app, ("qa", normalize_question(question)), answer, question, app["state"]["corpus"])
+    return web.json_response(result)
+
+async def handle_summarize(request):
+    app = request.app
+    question, body = await read_body(request)
+    if "case" in body:
+        case = read_cases(app, [body["case"]])[0]
+        key = ("summary", normalize_question(question), case)
+        result = await run_coalesced(app, key, summarize_in_case, question, app["shards"], case)
+    else:
+        result = await run_coalesced(app, ("summary", normalize_question(question)), summarize, question, app["state"]["corpus"])
+    return web.json_response(result)
+
+async def handle_cases(request):
+    return web.json_response({"cases": request.app["shards"].list_cases()})
+
+async def handle_ingest(request):
+    app = request.app
+    # Only one ingest at a time; each query holds the corpus it started with, and the
+    # refreshed one is swapped in whole when it is ready
+    async with app["ingest_lock"]:
+        result = await run_blocking(app, ingest, app["state"])
+    return web.json_response(result)
+
+async def handle_metrics(request):
+    return web.json_response(METRICS.snapshot())
+
+async def handle_health(request):
+    corpus = request.app["state"]["corpus"]
+    return web.json_response({"status": "ok", "document_path": corpus.document_path, "chunks": len(corpus.documents)})
+
+async def on_startup(app):
+    # Created inside the running loop, older Pythons bind them to the loop at construction
+    app["llm_semaphore"] = asyncio.Semaphore(app["llm_concurrency"])
+    app["ingest_lock"] = asyncio.Lock()
+    logger.info(f"Loading corpus from {app['document_path']}")
+    app["state"]["corpus"] = await run_blocking(app, get_corpus, app["document_path"])
+
+async def close_executor(app):
+    app["executor"].shutdown(wait=False)
+    export_metrics()
+
+def create_app(document_path=DOCUMENT_PATH, llm_concurrency=LLM_CONCURRENCY):
+    app = web.Application()
+    app["document_path"] = document_path
+    # Extra threads so retrieval and ingest aren't starved by requests waiting on the LLM
+    app["executor"] = ThreadPoolExecutor(max_workers=llm_concurrency + 4)
+    app["llm_concurrency"] = llm_concurrency
+    app["inflight"] = {}
+    # The current corpus; ingest replaces it, handlers read it once per request
+    app["state"] = {}
+    # Cases are loaded on first query, not at startup
+    app["shards"] = CaseShards()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(close_executor)
+    app.router.add_post("/qa", handle_qa)
+    app.router.add_post("/summarize", handle_summarize)
+    app.router.add_post("/ingest", handle_ingest)
+    app.router.add_get("/cases", handle_cases)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/health", handle_health)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the legal case analysis tool over HTTP.")
+    parser.add_argument("--document-path", default=DOCUMENT_PATH)
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY)
+    args = parser.parse_args()
+    web.run_app(create_app(args.document_path, args.llm_concurrency), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
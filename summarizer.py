@@ -1,35 +1,23 @@
-from llm_interface import setup_llm
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from llm_interface import invoke_llm, stream_llm_section, LLM_ERROR_MESSAGE
 from prompts import (
     refine_question_prompt,
     extract_key_case_info,
     followup_case_questions,
-    consolidate_and_summarize_case
+    consolidate_and_summarize_case,
+    summarize_chunk_prompt,
+    reduce_summaries_prompt
 )
 from utils import prepare_context, format_context
-from retrieval import get_hybrid_retriever
+from context_packing import pack_context, count_tokens, get_context_budget
+from config import MODEL_NAME, SUMMARY_CACHE_DIR, MAP_REDUCE_FAN_IN, LLM_CONCURRENCY
+from retrieval import get_hybrid_retriever, get_corpus_version
+from answer_cache import ANSWER_CACHE
+from tracing import span, bind_trace
 from logging_config import logger
 
-# Wrapper for LLM invocation with error handling
-def invoke_llm(prompt):
-    """Wrapper for LLM invocation with error handling."""
-    try:
-        llm = setup_llm()
-        response = llm.invoke(prompt)
-        return response.content.strip()
-    except Exception as e:
-        logger.error(f"Error invoking LLM: {str(e)}")
-        return "Error in generating response from LLM."
-
-# Function to truncate context if too long
-def truncate_context(context, max_tokens=2000):
-    """Truncate context to fit within a specific token limit."""
-    words = context.split()
-    if len(words) > max_tokens:
-        truncated_context = ' '.join(words[:max_tokens])
-        logger.warning(f"Context was too long, truncated to {max_tokens} tokens.")
-        return truncated_context
-    return context
-
 # Function to handle cases where no relevant data is found
 def handle_insufficient_data(data):
     """Handle cases where no relevant data is retrieved."""
@@ -39,14 +27,28 @@ def handle_insufficient_data(data):
     return data
 
 # Refining the user's question using LLM
-def refine_question(question):
+def refine_question(question, use_cache=True):
     logger.info("Refining user question.")
+    # Refinement doesn't depend on the documents, and only exact repeats are reused
+    if use_cache:
+        cached = ANSWER_CACHE.get("refine", question, None, semantic=False)
+        if cached is not None:
+            return cached
     prompt = refine_question_prompt().format(user_question=question)
-    refined_question = invoke_llm(prompt)
+    refined_question = invoke_llm(prompt, stage="refine")
+    if use_cache and refined_question != LLM_ERROR_MESSAGE:
+        ANSWER_CACHE.put("refine", question, None, refined_question, semantic=False)
     return refined_question
 
+# Sections of a case summary, in the order they are generated
+SUMMARY_SECTIONS = {
+    "initial_findings": "Initial Findings",
+    "followup_info": "Follow-up Information",
+    "final_summary": "Final Summary"
+}
+
 # Summarizing the legal case
-def summarize_case(question, documents, vector_store):
+def summarize_case(question, documents, vector_store, use_cache=True, retrieved_docs=None, retriever=None, corpus_version=None):
     """
     Summarize the legal case based on the provided question and documents.
     Works for various legal cases, including civil, criminal, regulatory, and more.
@@ -54,44 +56,176 @@ def summarize_case(question, documents, vector_store):
     For civil cases, ensure extraction of contract disputes, negligence claims, etc.
     For criminal cases, include charges, indictments, and possible penalties.
     For administrative/regulatory cases, include citations to relevant laws or codes.
+
+    Pass retrieved_docs to reuse documents already retrieved for the question in step 1, and
+    retriever and corpus_version to summarize a corpus other than the configured one.
+    """
+    events = stream_summarize_case(question, documents, vector_store, use_cache, retrieved_docs, retriever, corpus_version)
+    for section, value in events:
+        if section == "result":
+            return value
+
+def stream_summarize_case(question, documents, vector_store, use_cache=True, retrieved_docs=None, retriever=None, corpus_version=None):
+    """
+    Streaming variant of summarize_case. Yields (section, token) pairs as the model generates
+    each stage, with section one of SUMMARY_SECTIONS. The last item is ("result", summary_dict),
+    where summary_dict is what summarize_case returns.
     """
     logger.info("Starting case summarization process.")
-    retriever = get_hybrid_retriever(documents, vector_store)
+    corpus_version = corpus_version or get_corpus_version()
+    if use_cache:
+        cached = ANSWER_CACHE.get("summary", question, corpus_version)
+        if cached is not None:
+            logger.info("Summary served from cache.")
+            for section in SUMMARY_SECTIONS:
+                yield section, cached[section]
+            yield "result", cached
+            return
+
+    retriever = retriever or get_hybrid_retriever(documents, vector_store)
 
     # Step 1: Retrieve relevant documents based on the initial question
-    relevant_docs = retriever.get_relevant_documents(question)
-    structured_context = prepare_context(relevant_docs)
-    structured_context = handle_insufficient_data(structured_context)
-    formatted_context = format_context(structured_context)
-    formatted_context = truncate_context(formatted_context)
+    if retrieved_docs is not None:
+        relevant_docs = retrieved_docs
+    else:
+        with span("retrieve") as attributes:
+            relevant_docs = retriever.get_relevant_documents(question)
+            attributes["chunks"] = len(relevant_docs)
+    # Pack whole chunks into the model's token budget, most relevant first
+    with span("pack_context"):
+        structured_context = pack_context(prepare_context(relevant_docs))
+        structured_context = handle_insufficient_data(structured_context)
+        formatted_context = format_context(structured_context)
 
     # Step 2: Extract Key Case Information
     prompt = extract_key_case_info().format(context=formatted_context)
-    initial_findings = invoke_llm(prompt)
+    initial_findings = yield from stream_llm_section("initial_findings", prompt)
 
     # Step 3: Follow-up Questions and Additional Search
-    additional_docs = retriever.get_relevant_documents(initial_findings)
-    additional_context = prepare_context(additional_docs)
-    additional_context = handle_insufficient_data(additional_context)
-    formatted_additional_context = format_context(additional_context)
-    formatted_additional_context = truncate_context(formatted_additional_context)
+    with span("followup_retrieve") as attributes:
+        additional_docs = retriever.get_relevant_documents(initial_findings)
+        attributes["chunks"] = len(additional_docs)
+    with span("followup_pack_context"):
+        additional_context = pack_context(prepare_context(additional_docs))
+        additional_context = handle_insufficient_data(additional_context)
+        formatted_additional_context = format_context(additional_context)
 
     followup_prompt = followup_case_questions().format(
         initial_context=initial_findings,
         additional_context=formatted_additional_context
     )
-    followup_info = invoke_llm(followup_prompt)
+    followup_info = yield from stream_llm_section("followup_info", followup_prompt)
 
     # Step 4: Consolidate Findings and Draft Summary
     consolidate_prompt = consolidate_and_summarize_case().format(
         initial_findings=initial_findings,
         followup_info=followup_info
     )
-    final_summary = invoke_llm(consolidate_prompt)
+    final_summary = yield from stream_llm_section("final_summary", consolidate_prompt)
 
-    return {
+    result = {
         "initial_findings": initial_findings,
         "followup_info": followup_info,
         "final_summary": final_summary,
         "structured_context": structured_context
     }
+    # Don't keep summaries where one of the LLM calls failed
+    if use_cache and not any(LLM_ERROR_MESSAGE in text for text in (initial_findings, followup_info, final_summary)):
+        ANSWER_CACHE.put("summary", question, corpus_version, result)
+    yield "result", result
+
+
+# Map-reduce summarization of the entire case file
+def cached_summary(kind, text, prompt, cache_dir=SUMMARY_CACHE_DIR):
+    """Run the summary prompt unless a summary of exactly this text is already cached on disk."""
+    key = hashlib.sha256(f"{MODEL_NAME}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+    path = os.path.join(cache_dir, key[:2], f"{key}.txt") if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    summary = invoke_llm(prompt, stage=kind)
+    if path and summary != LLM_ERROR_MESSAGE:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(summary)
+        os.replace(tmp_path, path)
+    return summary
+
+def group_chunks(documents, budget=None):
+    """
+    Group consecutive chunks of each file into groups that fit the context budget.
+    Returns {source: [group_text, ...]} with files and groups in a stable order.
+    """
+    budget = budget or get_context_budget()
+    groups = {}
+    for source in sorted({str(doc.metadata.get("source", "Unknown")) for doc in documents}):
+        groups[source] = []
+    current_source, current, current_tokens = None, [], 0
+    for item in prepare_context(documents):
+        block = f"File: {item['file_name']}, Page: {item['page_number']}\n{item['content']}\n"
+        tokens = count_tokens(block)
+        if current and (item["file_name"] != current_source or current_tokens + tokens > budget):
+            groups[str(current_source)].append("\n".join(current))
+            current, current_tokens = [], 0
+        current_source = item["file_name"]
+        current.append(block)
+        current_tokens += tokens
+    if current:
+        groups[str(current_source)].append("\n".join(current))
+    return {source: texts for source, texts in groups.items() if texts}
+
+def summarize_group(text):
+    return cached_summary("map", text, summarize_chunk_prompt().format(context=text))
+
+def reduce_group(summaries):
+    text = "\n\n".join(summaries)
+    return cached_summary("reduce", text, reduce_summaries_prompt().format(summaries=text))
+
+def reduce_levels(branches, executor, fan_in):
+    """Reduce every branch's list of summaries to one, level by level, running each level concurrently."""
+    while any(len(summaries) > 1 for summaries in branches.values()):
+        jobs = []
+        for name, summaries in branches.items():
+            for start in range(0, len(summaries), fan_in):
+                jobs.append((name, summaries[start:start + fan_in]))
+        reduced = executor.map(bind_trace(lambda job: job[1][0] if len(job[1]) == 1 else reduce_group(job[1])), jobs)
+        next_branches = {name: [] for name in branches}
+        for (name, _), summary in zip(jobs, reduced):
+            next_branches[name].append(summary)
+        branches = next_branches
+    return {name: summaries[0] for name, summaries in branches.items()}
+
+def summarize_case_map_reduce(documents, fan_in=MAP_REDUCE_FAN_IN, concurrency=LLM_CONCURRENCY):
+    """
+    Summarize the entire case file rather than the top retrieved chunks.
+    Chunks are grouped per file into context-sized groups and summarized concurrently, each
+    file's summaries are reduced in a tree, and the file summaries are reduced into the final
+    summary. Every intermediate summary is cached by content hash, so after adding a filing only
+    its own groups and the reductions above them are sent to the LLM.
+    """
+    logger.info("Starting map-reduce summarization of the entire case.")
+    with span("group_chunks"):
+        groups = group_chunks(documents)
+    if not groups:
+        return {"final_summary": handle_insufficient_data([]), "file_summaries": {}, "group_count": 0}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Map: summarize every group of every file
+        jobs = [(source, text) for source, texts in groups.items() for text in texts]
+        summaries = executor.map(bind_trace(lambda job: summarize_group(job[1])), jobs)
+        branches = {source: [] for source in groups}
+        for (source, _), summary in zip(jobs, summaries):
+            branches[source].append(summary)
+
+        # Reduce: each file to one summary, then all files to the case summary
+        file_summaries = reduce_levels(branches, executor, fan_in)
+        final_summary = reduce_levels({"case": list(file_summaries.values())}, executor, fan_in)["case"]
+
+    logger.info(f"Summarized {len(jobs)} chunk groups from {len(groups)} files.")
+    return {
+        "final_summary": final_summary,
+        "file_summaries": file_summaries,
+        "group_count": len(jobs)
+    }
@@ -7,53 +7,21 @@ from summarizer import refine_question, summarize_case
 from chatbot import answer_question
 from config import COLLECTION_NAME, PERSIST_DIRECTORY
 from logging_config import logger
-import re
 from document_processing import retrieve_and_answer_question
+from case_metadata import load_metadata_index, build_metadata_index
 
 def extract_case_metadata(documents):
     """Extract metadata like case name, year, case number, and potentially other information from legal documents."""
-    case_metadata = {}
-
-    # Define regular expressions for metadata extraction
-    case_name_pattern = r"([A-Z][a-zA-Z]*\s+v\.\s+[A-Z][a-zA-Z]*)"
-    year_pattern = r"\b(?:19|20)\d{2}\b"  # Four-digit years starting with 19 or 20
-    # Updated court name pattern to ensure it captures "Court of Appeals of Texas"
-    court_name_pattern = r"(Court of Appeals|District Court|Supreme Court|Circuit Court|Family Court|Tribunal)\s+(of\s+[A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)"
-    case_number_pattern = r"No\.\s*([\w\-–]+)"  # Pattern to match case numbers (e.g., No. 01–93–00091–CV)
-
-    for doc in documents:
-        # Extract document content from page_content
-        content = doc.page_content if hasattr(doc, 'page_content') else doc['content']
-
-        # Extract the case name (e.g., "Dunnings v. Castro")
-        case_name_match = re.search(case_name_pattern, content)
-        if case_name_match:
-            case_metadata['case_name'] = case_name_match.group(1)
-
-        # Extract all possible years
-        years = re.findall(year_pattern, content)
-        if years:
-            # Convert all matched years to four digits and pick the earliest year
-            full_years = re.findall(r"\b(?:19|20)\d{2}\b", content)
-            sorted_years = sorted(set(full_years), key=lambda x: int(x))
-            case_metadata['year'] = sorted_years[0]  # Pick the oldest year
-
-        # Extract the full court name (e.g., "Court of Appeals of Texas")
-        court_match = re.search(court_name_pattern, content, re.IGNORECASE)
-        if court_match:
-            court_type = court_match.group(1)  # e.g., "Court of Appeals"
-            jurisdiction = court_match.group(2).strip()  # e.g., "of Texas"
-            full_court_name = f"{court_type} {jurisdiction}"  # Combine for "Court of Appeals of Texas"
-            case_metadata['court_name'] = full_court_name
-
-        # Extract the case number (e.g., "No. 01–93–00091–CV")
-        case_number_match = re.search(case_number_pattern, content)
-        if case_number_match:
-            case_metadata['case_number'] = case_number_match.group(1)
-
-        # Log and return as soon as the metadata is found
-        if case_metadata:
-            break  # Assuming we stop after finding metadata in the first match
+    # Read from the metadata index built at ingest time; only scan the documents if it is missing or out of date
+    index = load_metadata_index()
+    if index is None or len(index["chunks"]) != len(documents):
+        index = build_metadata_index(documents)
+    case = index["case"]
+    case_metadata = {
+        key: case[key]
+        for key in ("case_name", "year", "court_name", "case_number")
+        if case[key]
+    }
 
     # Log extracted metadata
     logger.info(f"Extracted metadata: {case_metadata}")
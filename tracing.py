@@ -0,0 +1,211 @@
+# tracing.py
+
+"""
+Per-stage latency tracing and aggregate metrics.
+
+Entry points wrap each request in trace(...); code inside times its stages with span(...).
+A finished trace is written as JSON to TRACE_DIRECTORY, and every span also feeds the
+process-wide METRICS, which keep p50/p95 latencies per stage and token counters and can be
+exported to a file or POSTed to a local collector.
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import threading
+import contextvars
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from config import TRACING_ENABLED, TRACE_DIRECTORY, METRICS_WINDOW, METRICS_EXPORT_PATH, METRICS_EXPORT_URL
+from logging_config import logger
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+class Metrics:
+    """Latest durations per stage (for p50/p95) and running counters, shared by all threads."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._durations = {}
+        self._counts = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, duration_ms):
+        with self._lock:
+            self._durations.setdefault(name, deque(maxlen=self.window)).append(duration_ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self._durations.items()}
+            counts = dict(self._counts)
+            counters = dict(self._counters)
+        stages = {}
+        for name, values in sorted(durations.items()):
+            stages[name] = {
+                "count": counts[name],
+                "p50_ms": round(percentile(values, 0.50), 3),
+                "p95_ms": round(percentile(values, 0.95), 3),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "max_ms": round(values[-1], 3)
+            }
+        return {"stages": stages, "counters": counters}
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._counters.clear()
+
+METRICS = Metrics()
+
+class Trace:
+    """Spans of one request, in the order they finished."""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        llm_spans = [s for s in spans if s["name"].startswith("llm.")]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "llm": {
+                "calls": len(llm_spans),
+                "input_tokens": sum(s.get("input_tokens", 0) for s in llm_spans),
+                "output_tokens": sum(s.get("output_tokens", 0) for s in llm_spans)
+            },
+            "spans": spans
+        }
+
+_CURRENT_TRACE = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace():
+    return _CURRENT_TRACE.get()
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a stage. Yields a dict of attributes that the caller can add to (e.g. token counts);
+    the span is recorded in the current trace, if any, and in METRICS.
+    """
+    if not TRACING_ENABLED:
+        yield attributes
+        return
+    trace = _CURRENT_TRACE.get()
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        end = time.perf_counter()
+        duration_ms = (end - start) * 1000
+        METRICS.observe(name, duration_ms)
+        if trace is not None:
+            record = {"name": name, "start_ms": round((start - trace.start) * 1000, 3), "duration_ms": round(duration_ms, 3)}
+            record.update(attributes)
+            trace.add_span(record)
+
+@contextmanager
+def trace(name, **attributes):
+    """
+    Trace one request. Nested inside another trace it is just a span, so entry points can
+    be called from each other. The finished trace is dumped to TRACE_DIRECTORY.
+    """
+    if not TRACING_ENABLED or _CURRENT_TRACE.get() is not None:
+        with span(name, **attributes) as span_attributes:
+            yield span_attributes
+        return
+    current = Trace(name, **attributes)
+    token = _CURRENT_TRACE.set(current)
+    try:
+        yield current.attributes
+    finally:
+        _CURRENT_TRACE.reset(token)
+        current.duration_ms = round((time.perf_counter() - current.start) * 1000, 3)
+        METRICS.observe(f"request.{name}", current.duration_ms)
+        METRICS.increment(f"requests.{name}")
+        dump_trace(current)
+
+def bind_trace(func):
+    """Wrap func so it records into the caller's trace when run on a worker thread."""
+    current = _CURRENT_TRACE.get()
+
+    def run(*args, **kwargs):
+        token = _CURRENT_TRACE.set(current)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CURRENT_TRACE.reset(token)
+    return run
+
+def record_llm_tokens(attributes, input_tokens, output_tokens):
+    """Add token counts to an LLM span and to the aggregate counters."""
+    attributes["input_tokens"] = input_tokens
+    attributes["output_tokens"] = output_tokens
+    METRICS.increment("llm.input_tokens", input_tokens)
+    METRICS.increment("llm.output_tokens", output_tokens)
+
+def dump_trace(finished, trace_directory=TRACE_DIRECTORY):
+    if not trace_directory:
+        return None
+    try:
+        os.makedirs(trace_directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(trace_directory, f"{stamp}-{finished.name}-{finished.trace_id[:8]}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(finished.to_dict(), f, indent=2, default=str)
+        return path
+    except OSError as e:
+        logger.error(f"Could not write trace: {str(e)}")
+        return None
+
+def export_metrics(path=METRICS_EXPORT_PATH, url=METRICS_EXPORT_URL):
+    """Write the metrics snapshot to a JSON file and/or POST it to a local endpoint."""
+    snapshot = METRICS.snapshot()
+    snapshot["exported_at"] = datetime.now(timezone.utc).isoformat()
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp_path, path)
+    if url:
+        request = urllib.request.Request(
+            url, data=json.dumps(snapshot).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            logger.error(f"Could not export metrics to {url}: {str(e)}")
+    return snapshot
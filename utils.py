@@ -34,17 +34,3 @@ def extract_source_and_page(chunks):
     
     # Join the list of results into a single string, each on a new line
     return "\n".join(results)
-    
-def truncate_context(context, max_tokens=2000):
-    """Truncate context to fit within a specific token limit."""
-    # Split the context into words (or tokens, depending on your tokenizer)
-    words = context.split()
-    
-    # If the context exceeds the maximum token limit, truncate it
-    if len(words) > max_tokens:
-        truncated_context = ' '.join(words[:max_tokens])
-        print(f"Context truncated to {max_tokens} tokens.")
-        return truncated_context
-    
-    # Return the original context if it's within the token limit
-    return context